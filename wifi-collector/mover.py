@@ -1,23 +1,99 @@
 import time
+import errno
 import shutil
 from pathlib import Path
 
+# watchdog is optional: with it, files are moved on inotify events instead of
+# re-globbing SOURCE every few seconds
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 SOURCE = Path("/home/rushi/wifi-collector")
 DEST = Path("/home/rushi/wifi-heatmap-dashboard/data")
 
-print("📡 Auto-mover started...")
-print("Watching:", SOURCE)
-print("Moving to:", DEST)
 
-already_moved = set()
+def move_file(file):
+    """Move a single CSV file into the dashboard data folder"""
+    dest_file = DEST / file.name
+    if dest_file.exists():
+        # rename() would silently overwrite. Set the source aside for manual
+        # review under a name the *.csv glob no longer matches, so the polling
+        # loop does not report it again every pass.
+        aside = file.with_name(file.name + ".duplicate")
+        print(f"Skipping {file.name}: already exists in {DEST}; kept as {aside.name}")
+        try:
+            file.rename(aside)
+        except FileNotFoundError:
+            pass
+        return
+
+    print(f"Moving {file.name} -> {DEST}")
+    try:
+        # Single rename syscall when both folders share a filesystem
+        file.rename(dest_file)
+    except FileNotFoundError:
+        # Already moved by an earlier event or pass
+        pass
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            # Permissions, full disk, ...: leave the file for the next pass
+            print(f"Could not move {file.name}: {e}")
+            return
+        # Cross-filesystem: copy then unlink
+        shutil.move(str(file), str(dest_file))
+
+
+class CsvMoveHandler(FileSystemEventHandler):
+    """Moves CSV files as soon as the writer closes them"""
+
+    def on_closed(self, event):
+        if not event.is_directory and event.src_path.endswith(".csv"):
+            move_file(Path(event.src_path))
+
+    def on_moved(self, event):
+        # Files renamed into SOURCE (e.g. atomic temp-file writes) are complete
+        dest_path = Path(event.dest_path)
+        if not event.is_directory and dest_path.suffix == ".csv" and dest_path.parent == SOURCE:
+            move_file(dest_path)
+
+
+def watch_with_inotify():
+    """Move files on filesystem events; idle between them"""
+    observer = Observer()
+    observer.schedule(CsvMoveHandler(), str(SOURCE), recursive=False)
+    observer.start()
+    try:
+        # Pick up anything written while the mover was not running. The
+        # observer is already watching, so a file closed during this pass is
+        # caught by one or the other.
+        for file in SOURCE.glob("*.csv"):
+            move_file(file)
+
+        observer.join()
+    finally:
+        observer.stop()
+
+
+def watch_with_polling():
+    """Fallback when watchdog is not installed: re-check SOURCE every 5 seconds"""
+    while True:
+        # A moved file leaves SOURCE, so each glob only sees new files
+        for file in SOURCE.glob("*.csv"):
+            move_file(file)
+
+        time.sleep(5)
 
-while True:
-    for file in SOURCE.glob("*.csv"):
-        dest_file = DEST / file.name
 
-        if file.name not in already_moved:
-            print(f"Moving {file.name} -> {DEST}")
-            shutil.move(str(file), str(dest_file))
-            already_moved.add(file.name)
+if __name__ == "__main__":
+    print("📡 Auto-mover started...")
+    print("Watching:", SOURCE)
+    print("Moving to:", DEST)
 
-    time.sleep(5)
+    if Observer is not None:
+        watch_with_inotify()
+    else:
+        watch_with_polling()
@@ -1,26 +1,88 @@
 import subprocess
+import errno
+import re
+import select
 import time
 import sqlite3
 from datetime import datetime
 from pathlib import Path
 from flask import Flask, render_template_string, request, jsonify
 import threading
+import atexit
+
+# pyroute2 is optional: when present (and the process has CAP_NET_ADMIN) scans
+# are read straight from the kernel over NL80211 instead of forking nmcli.
+try:
+    from pyroute2 import IW, IPRoute
+    from pyroute2.netlink import NLM_F_ACK, NLM_F_DUMP, NLM_F_REQUEST
+    from pyroute2.netlink.nl80211 import NL80211, NL80211_NAMES, nl80211cmd
+except ImportError:
+    IW = None
+
+# waitress is optional: a production WSGI server for the control panel,
+# otherwise Flask's built-in server is used in threaded mode
+try:
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None
 
 # The path logic correctly points to the central database location
 DB_PATH = Path(__file__).parent.parent / "wifi-heatmap-dashboard" / "data" / "wifi_data.db"
-location = "Test"   # Default location - changeable via web control panel
+_location = "Test"   # Default location - changeable via web control panel
+_location_lock = threading.Lock()  # Written by the control server, read by the scan loop
+WIFI_INTERFACE = "wlan0"  # Interface used for NL80211 scans
+nl80211_enabled = IW is not None
+SCAN_TIMEOUT = 5.0  # Seconds to wait for the kernel to report scan completion
+NL80211_MAX_TIMEOUTS = 3  # Consecutive timed-out scans before sticking with nmcli
+nl80211_timeouts = 0
+
+# One line of `nmcli -t -e no -f IN-USE,SSID,BSSID,SIGNAL,CHAN,FREQ,SECURITY`.
+# The SSID may itself contain colons, so it is delimited by the fixed-format BSSID.
+NMCLI_LINE_PATTERN = re.compile(
+    r"^([^:]*):(.*):((?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}):(\d+):([^:]*):([^:]*):([^:]*)$"
+)
+
+# Raw 0-100 signal to dBm; non-positive values are already dBm (imported data)
+SIGNAL_DBM_EXPR = "CASE WHEN signal > 0 THEN signal / 2.0 - 100.0 ELSE COALESCE(signal, 0) END"
 
 # Flask app for room control
 control_app = Flask(__name__)
 
+def get_location():
+    """Return the current scanning location"""
+    with _location_lock:
+        return _location
+
+def set_location_value(new_location):
+    """Change the scanning location"""
+    global _location
+    with _location_lock:
+        _location = new_location
+
+# Long-lived write connection shared by the scan loop, opened on first save.
+# The control server runs in the same process, so access goes through a lock.
+_write_conn = None
+_write_lock = threading.Lock()
+
 def init_database():
     """Initialize SQLite database with schema and necessary indexes."""
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
+    # WAL lets the dashboard read while the scanner appends; NORMAL sync is
+    # safe under WAL and avoids an fsync per commit. journal_mode persists
+    # in the database file, the remaining pragmas are per-connection.
+    # auto_vacuum and page_size only apply to new files (existing ones need a VACUUM).
+    cursor.execute("PRAGMA page_size=8192")  # must come before auto_vacuum on a new file
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")
+    
     # Schema must match the fields collected
-    cursor.execute("""
+    cursor.execute(f"""
         CREATE TABLE IF NOT EXISTS wifi_scans (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp TEXT NOT NULL,
@@ -31,41 +93,212 @@ def init_database():
             channel INTEGER,
             frequency TEXT,
             security TEXT,
-            vendor TEXT
+            vendor TEXT,
+            signal_dbm REAL GENERATED ALWAYS AS ({SIGNAL_DBM_EXPR}) STORED
         )
     """)
     
+    # Databases created before signal_dbm existed: SQLite only allows adding
+    # VIRTUAL generated columns with ALTER TABLE
+    columns = [row[1] for row in cursor.execute("PRAGMA table_xinfo(wifi_scans)")]
+    if "signal_dbm" not in columns:
+        cursor.execute(f"""
+            ALTER TABLE wifi_scans
+            ADD COLUMN signal_dbm REAL GENERATED ALWAYS AS ({SIGNAL_DBM_EXPR}) VIRTUAL
+        """)
+    
     # Indexes speed up data retrieval and analysis
+    # Time-window filters, alone or grouped by room
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_timestamp ON wifi_scans(timestamp)
+        CREATE INDEX IF NOT EXISTS idx_ts_room ON wifi_scans(timestamp, room)
     """)
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_room ON wifi_scans(room)
+        CREATE INDEX IF NOT EXISTS idx_ssid ON wifi_scans(ssid)
     """)
+    # Alert and analyzer queries filter/group by (room, ssid) within a time window
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_ssid ON wifi_scans(ssid)
+        CREATE INDEX IF NOT EXISTS idx_room_ssid_ts ON wifi_scans(room, ssid, timestamp)
     """)
+    # Superseded by the leftmost column of idx_room_ssid_ts
+    cursor.execute("DROP INDEX IF EXISTS idx_room")
+    # Superseded by the leftmost column of idx_ts_room
+    cursor.execute("DROP INDEX IF EXISTS idx_timestamp")
     
     conn.commit()
+    
+    # Refresh planner statistics so the composite index gets picked
+    cursor.execute("ANALYZE")
     conn.close()
 
+def frequency_to_channel(freq):
+    """Convert a centre frequency in MHz to its WiFi channel number"""
+    if freq == 2484:
+        return 14
+    if 2412 <= freq <= 2472:
+        return (freq - 2407) // 5
+    if 5000 <= freq < 5925:
+        return (freq - 5000) // 5
+    if 5950 <= freq <= 7115:
+        return (freq - 5950) // 5
+    return None
+
+def describe_security(bss, elements):
+    """Build an nmcli-style security label from the BSS capability and IEs"""
+    labels = []
+    for vendor_ie in elements.get("VENDOR", []):
+        # Microsoft OUI, type 1 is the legacy WPA element
+        if vendor_ie[:4] == b"\x00\x50\xf2\x01":
+            labels.append("WPA1")
+            break
+    rsn = elements.get("RSN")
+    if rsn:
+        auth_suites = [a for a in rsn.get("auth_suites") or [] if a]
+        wpa3_suites = [a for a in auth_suites if "SAE" in a or a == "OWE"]
+        if wpa3_suites:
+            labels.append("WPA3")
+        if len(wpa3_suites) < len(auth_suites) or not auth_suites:
+            labels.append("WPA2")
+    if not labels:
+        capability = bss.get_attr("NL80211_BSS_CAPABILITY") or {}
+        if capability.get("VALUE", 0) & 0x0010:  # WLAN_CAPABILITY_PRIVACY
+            labels.append("WEP")
+    return " ".join(labels)
+
+def wait_for_scan_results(events, timeout):
+    """
+    Block on the NL80211 scan multicast socket until the kernel reports
+    results (or an aborted scan), giving up after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([events], [], [], remaining)[0]:
+            raise TimeoutError(f"NL80211 scan did not complete within {timeout}s")
+        
+        for msg in events.get():
+            event = msg.get("event")
+            if event == "NL80211_CMD_NEW_SCAN_RESULTS":
+                return
+            if event == "NL80211_CMD_SCAN_ABORTED":
+                raise RuntimeError("NL80211 scan was aborted")
+
+def scan_wifi_nl80211():
+    """
+    Triggers a scan over NL80211 and builds results from the typed BSS
+    attributes. Completion is signalled by the kernel's NEW_SCAN_RESULTS
+    event, so no fixed delay is needed.
+    """
+    with IPRoute() as ipr:
+        ifindex = ipr.link_lookup(ifname=WIFI_INTERFACE)[0]
+    
+    with IW() as iw, NL80211() as events:
+        # Subscribe before triggering so the completion event cannot be missed
+        events.bind()
+        events.add_membership("scan")
+        
+        trigger = nl80211cmd()
+        trigger["cmd"] = NL80211_NAMES["NL80211_CMD_TRIGGER_SCAN"]
+        # One empty SSID requests an active wildcard probe, as `nmcli --rescan`
+        # does; a passive scan dwells on every channel and can outrun SCAN_TIMEOUT
+        trigger["attrs"] = [
+            ["NL80211_ATTR_IFINDEX", ifindex],
+            ["NL80211_ATTR_SCAN_SSIDS", [""]],
+        ]
+        iw.nlm_request(trigger, msg_type=iw.prid, msg_flags=NLM_F_REQUEST | NLM_F_ACK)
+        
+        wait_for_scan_results(events, SCAN_TIMEOUT)
+        
+        dump = nl80211cmd()
+        dump["cmd"] = NL80211_NAMES["NL80211_CMD_GET_SCAN"]
+        dump["attrs"] = [["NL80211_ATTR_IFINDEX", ifindex]]
+        messages = iw.nlm_request(dump, msg_type=iw.prid, msg_flags=NLM_F_REQUEST | NLM_F_DUMP)
+    
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    room = get_location()
+    results = []
+    
+    for msg in messages:
+        bss = msg.get_attr("NL80211_ATTR_BSS")
+        if bss is None:
+            continue
+        
+        elements = bss.get_attr("NL80211_BSS_INFORMATION_ELEMENTS") or {}
+        ssid = elements.get("SSID", b"").decode("utf-8", errors="replace")
+        if ssid.strip() == "":
+            continue
+        
+        signal_mbm = bss.get_attr("NL80211_BSS_SIGNAL_MBM")
+        if signal_mbm is None:
+            continue
+        # Store the same 0-100 quality scale nmcli reports (dBm = signal / 2 - 100)
+        signal_dbm = signal_mbm["SIGNAL_STRENGTH"]["VALUE"]
+        raw_signal = max(0, min(100, int(round((signal_dbm + 100) * 2))))
+        
+        bssid = (bss.get_attr("NL80211_BSS_BSSID") or "").upper()
+        freq = bss.get_attr("NL80211_BSS_FREQUENCY")
+        channel = frequency_to_channel(freq) if freq else None
+        
+        results.append({
+            "timestamp": timestamp,
+            "room": room,
+            "ssid": ssid,
+            "bssid": bssid,
+            "signal": raw_signal,
+            "channel": str(channel) if channel else None,
+            "frequency": f"{freq} MHz" if freq else None,
+            "security": describe_security(bss, elements),
+            "vendor": bssid[:8] if len(bssid) >= 8 else ""
+        })
+    
+    return results
+
 def scan_wifi():
+    """
+    Collects nearby networks, preferring a direct NL80211 scan and falling
+    back to nmcli when pyroute2 is missing or the scan is not permitted.
+    """
+    global nl80211_enabled, nl80211_timeouts
+    
+    if nl80211_enabled:
+        try:
+            results = scan_wifi_nl80211()
+            nl80211_timeouts = 0
+            return results
+        except Exception as e:
+            print(f"NL80211 scan failed, falling back to nmcli: {e}")
+            # Missing CAP_NET_ADMIN or nl80211 support fails the same way every time
+            if getattr(e, "code", None) in (errno.EPERM, errno.ENOENT) or isinstance(e, PermissionError):
+                nl80211_enabled = False
+            # An adapter that keeps timing out would cost SCAN_TIMEOUT on top of nmcli every cycle
+            elif isinstance(e, TimeoutError):
+                nl80211_timeouts += 1
+                if nl80211_timeouts >= NL80211_MAX_TIMEOUTS:
+                    print(f"NL80211 scans timed out {nl80211_timeouts} times in a row; using nmcli from now on")
+                    nl80211_enabled = False
+    
+    return scan_wifi_nmcli()
+
+def scan_wifi_nmcli():
     """
     Triggers a fresh WiFi scan and collects metadata using nmcli.
-    Robustly handles the split output format.
+    Lines are parsed with a single precompiled regex anchored on the BSSID.
     """
     
-    # 1. Trigger a fresh scan using sudo to handle authorization issues
-    # NOTE: This will require a password prompt upon manual run.
+    # Fetch 7 core fields: IN-USE, SSID, BSSID, SIGNAL, CHAN, FREQ, SECURITY
+    # With --escape no, colons inside values are left as-is and parsed by NMCLI_LINE_PATTERN
+    list_cmd = ["nmcli", "-t", "-e", "no", "-f", "IN-USE,SSID,BSSID,SIGNAL,CHAN,FREQ,SECURITY", "dev", "wifi", "list"]
+    
+    # 1. Rescan and list in one call: with --rescan yes nmcli returns as soon as
+    # NetworkManager reports the scan finished, instead of sleeping a fixed delay.
+    # sudo handles authorization; NOTE: this will prompt for a password on manual runs.
+    output = None
     try:
-        subprocess.run(
-            ["sudo", "nmcli", "dev", "wifi", "rescan"], 
-            timeout=5,
+        output = subprocess.run(
+            ["sudo"] + list_cmd + ["--rescan", "yes"],
+            timeout=30,
             check=True,
             capture_output=True
-        )
-        # Crucial delay: Give the adapter time to compile new results
-        time.sleep(1.5)
+        ).stdout.decode("utf-8")
     except subprocess.TimeoutExpired:
         print("Warning: WiFi rescan command timed out.")
     except subprocess.CalledProcessError as e:
@@ -74,104 +307,85 @@ def scan_wifi():
     except Exception as e:
         print(f"Error triggering rescan: {e}")
 
-    # 2. Fetch the newly scanned results
-    try:
-        # Fetch 7 core fields: IN-USE, SSID, BSSID, SIGNAL, CHAN, FREQ, SECURITY
-        output = subprocess.check_output(
-            ["nmcli", "-t", "-f", "IN-USE,SSID,BSSID,SIGNAL,CHAN,FREQ,SECURITY", "dev", "wifi", "list"],
-            timeout=30
-        ).decode("utf-8")
-    except Exception as e:
-        print(f"Error fetching WiFi list: {e}")
-        return []
+    # 2. Fall back to NetworkManager's cached results if the rescan failed
+    if output is None:
+        try:
+            output = subprocess.check_output(
+                list_cmd + ["--rescan", "no"],
+                timeout=30
+            ).decode("utf-8")
+        except Exception as e:
+            print(f"Error fetching WiFi list: {e}")
+            return []
 
     results = []
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    room = get_location()
     
     for line in output.split("\n"):
         line = line.strip()
         if not line:
             continue
 
-        try:
-            # We must use the total number of expected parts to parse correctly, 
-            # as the BSSID (AA:BB:CC:DD:EE:FF) adds 5 extra colons.
-            # Expected parts: 1 (IN-USE) + 1 (SSID) + 6 (BSSID octets) + 1 (SIGNAL) + 1 (CHAN) + 1 (FREQ) + 1 (SECURITY) = 12 total
-            parts = line.split(':')
-            
-            if len(parts) < 12:
-                # Malformed line or missing fields
-                continue
-
-            # --- Parsing the 12 parts ---
-            in_use = parts[0]
-            ssid = parts[1] 
-            
-            # Reconstruct BSSID from the 6 octets (parts[2] through parts[7])
-            bssid = ":".join(parts[2:8]) 
-            
-            signal = parts[8]      # SIGNAL is at index 8 after 1 (IN-USE) + 1 (SSID) + 6 (BSSID)
-            channel = parts[9]
-            frequency = parts[10]
-            security = parts[11]
-            
-            # --- Cleanup and Validation ---
-            if ssid == "--" or ssid.strip() == "":
-                continue
-
-            # Signal cleanup and conversion (must be integer)
-            cleaned_signal = signal.strip().replace('\\', '')
-            try:
-                raw_signal = int(cleaned_signal)
-            except ValueError:
-                # This should no longer trigger due to BSSID fix, but keeps robust
-                print(f"Warning: Skipping record due to invalid signal value: {cleaned_signal} for {ssid}")
-                continue
-                
-            # --- Final Data Structure ---
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            vendor = bssid[:8] if bssid and len(bssid) >= 8 else ""
-
-            results.append({
-                "timestamp": timestamp,
-                "room": location,
-                "ssid": ssid,
-                "bssid": bssid,
-                "signal": raw_signal, 
-                "channel": channel.strip() if channel else None,
-                "frequency": frequency.strip() if frequency else None,
-                "security": security.strip() if security else None,
-                "vendor": vendor
-            })
-
-        except Exception as e:
-            print(f"Error parsing line '{line[:50]}...': {e}")
+        match = NMCLI_LINE_PATTERN.match(line)
+        if match is None:
+            # Malformed line or missing fields
+            print(f"Warning: Skipping unparseable line '{line[:50]}...'")
+            continue
+        
+        in_use, ssid, bssid, signal, channel, frequency, security = match.groups()
+        
+        # --- Cleanup and Validation ---
+        if ssid == "--" or ssid.strip() == "":
             continue
 
+        results.append({
+            "timestamp": timestamp,
+            "room": room,
+            "ssid": ssid,
+            "bssid": bssid,
+            "signal": int(signal),
+            "channel": channel.strip() or None,
+            "frequency": frequency.strip() or None,
+            "security": security.strip() or None,
+            "vendor": bssid[:8]
+        })
+
     return results
 
+def get_write_connection():
+    """Return the shared write connection, opening it on first use.
+    Callers must hold _write_lock."""
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _write_conn.execute("PRAGMA synchronous=NORMAL")
+        _write_conn.execute("PRAGMA temp_store=MEMORY")
+        atexit.register(_write_conn.close)
+    return _write_conn
+
 def save_to_database(scan_results):
-    """Save scan results to SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for result in scan_results:
-        cursor.execute("""
-            INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            result["timestamp"],
-            result["room"],
-            result["ssid"],
-            result["bssid"],
-            result["signal"],
-            result["channel"],
-            result["frequency"],
-            result["security"],
-            result["vendor"]
-        ))
+    """Save scan results to SQLite database in a single transaction"""
+    rows = [
+        (r["timestamp"], r["room"], r["ssid"], r["bssid"], r["signal"],
+         r["channel"], r["frequency"], r["security"], r["vendor"])
+        for r in scan_results
+    ]
     
-    conn.commit()
-    conn.close()
+    with _write_lock:
+        conn = get_write_connection()
+        
+        # One prepared statement bound for every row, committed once
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("""
+                INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
 
 @control_app.route("/")
 def control_panel():
@@ -229,24 +443,26 @@ def control_panel():
     </body>
     </html>
     """
-    return render_template_string(html, current_location=location)
+    return render_template_string(html, current_location=get_location())
 
 @control_app.route("/set_location", methods=["POST"])
 def set_location():
     """API endpoint to change scanning location"""
-    global location
     data = request.get_json()
     new_location = data.get("location", "").strip()
     
     if new_location:
-        location = new_location
-        return jsonify({"success": True, "location": location})
+        set_location_value(new_location)
+        return jsonify({"success": True, "location": new_location})
     
     return jsonify({"success": False, "error": "Invalid location"}), 400
 
 def run_control_server():
     """Run Flask control server in background thread"""
-    control_app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False)
+    if waitress_serve is not None:
+        waitress_serve(control_app, host="0.0.0.0", port=5001, threads=2)
+    else:
+        control_app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False, threaded=True)
 
 
 if __name__ == "__main__":
@@ -267,7 +483,7 @@ if __name__ == "__main__":
             # Save to database
             save_to_database(networks)
             
-            print(f"Scan complete at {location}: {len(networks)} networks saved to database")
+            print(f"Scan complete at {networks[0]['room']}: {len(networks)} networks saved to database")
             # Print first few networks for debugging
             for net in networks[:3]:
                 # Signal is raw (0-100) and convert to dBm for display
@@ -278,6 +494,6 @@ if __name__ == "__main__":
                     
                 print(f"  - {net['ssid']}: {signal_dbm:.2f} dBm, Channel {net['channel']}")
         else:
-            print(f"Warning: No networks found in scan at {location}. Retrying...")
+            print(f"Warning: No networks found in scan at {get_location()}. Retrying...")
         
         time.sleep(5)
\ No newline at end of file
@@ -7,187 +7,289 @@ import sqlite3
 from pathlib import Path
 from datetime import datetime, timedelta
 import json
+import math
+import os
+import tempfile
+import threading
 
 DB_PATH = Path(__file__).parent / "data" / "wifi_data.db"
-ALERTS_FILE = Path(__file__).parent / "data" / "alerts.json"
+ALERTS_FILE = Path(__file__).parent / "data" / "alerts.jsonl"
+LEGACY_ALERTS_FILE = Path(__file__).parent / "data" / "alerts.json"
+ALERT_STATE_FILE = Path(__file__).parent / "data" / "alert_state.json"
 
 # Alert thresholds
 SIGNAL_DEGRADATION_THRESHOLD = -10  # dBm drop to trigger alert
 POOR_SIGNAL_THRESHOLD = -80  # dBm absolute threshold
 NETWORK_DISAPPEARANCE_MINUTES = 30  # Minutes without seeing a network
 
+# Per-network running averages are exponentially time-weighted: "current"
+# follows roughly the last 15 minutes, "baseline" roughly the last 2 hours
+CURRENT_EWMA_MINUTES = 15
+BASELINE_EWMA_MINUTES = 120
+
+# After a sustained step drop of D dB, current - baseline peaks at
+# DEGRADATION_RESPONSE_PEAK * D (about 0.65 D, some 36 minutes later).
+# Dividing by it turns the gap back into the size of the drop.
+_PEAK_MINUTES = (math.log(BASELINE_EWMA_MINUTES / CURRENT_EWMA_MINUTES)
+                 * CURRENT_EWMA_MINUTES * BASELINE_EWMA_MINUTES
+                 / (BASELINE_EWMA_MINUTES - CURRENT_EWMA_MINUTES))
+DEGRADATION_RESPONSE_PEAK = (math.exp(-_PEAK_MINUTES / BASELINE_EWMA_MINUTES)
+                             - math.exp(-_PEAK_MINUTES / CURRENT_EWMA_MINUTES))
+STATE_RETENTION_HOURS = 2  # Forget networks not seen for this long
+CACHE_SIZE_KIB = 8192  # Page cache for alert queries, which only read recent rows
+
+
+def get_connection():
+    """Open a database connection with per-connection pragmas applied"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    return conn
+
+
+def write_atomic(path, text):
+    """Replace path with text so readers never see a half-written file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
 class AlertSystem:
     def __init__(self):
+        # The dashboard shares one instance across its request threads; the
+        # lock covers the running averages, the watermark and the alert list
+        self.lock = threading.RLock()
         self.alerts = self.load_alerts()
+        self.last_id, self.networks = self.load_state()
     
     def load_alerts(self):
-        """Load previous alerts from file"""
+        """Load previous alerts from file (one JSON object per line)"""
         if ALERTS_FILE.exists():
+            alerts, torn = [], False
             with open(ALERTS_FILE, 'r') as f:
-                return json.load(f)
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        alerts.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Partial line from an append cut short by a crash or power loss
+                        torn = True
+            if torn:
+                # Rewrite without it so the next append starts on a clean line
+                self.alerts = alerts
+                self.save_alerts()
+            return alerts
+        if LEGACY_ALERTS_FILE.exists():
+            # Convert the old single-array file once
+            with open(LEGACY_ALERTS_FILE, 'r') as f:
+                self.alerts = json.load(f)
+            self.save_alerts()
+            return self.alerts
         return []
     
     def save_alerts(self):
-        """Save alerts to file"""
-        ALERTS_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(ALERTS_FILE, 'w') as f:
-            json.dump(self.alerts, f, indent=2)
+        """Rewrite the alerts file atomically (compaction; add_alert only appends)"""
+        write_atomic(ALERTS_FILE, "".join(json.dumps(alert) + "\n" for alert in self.alerts))
     
-    def add_alert(self, alert_type, message, severity="warning", data=None):
-        """Add a new alert"""
-        alert = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "type": alert_type,
-            "message": message,
-            "severity": severity,
-            "data": data or {}
-        }
-        self.alerts.append(alert)
-        self.save_alerts()
-        return alert
+    def load_state(self):
+        """Load the scan watermark and per-network running averages"""
+        if ALERT_STATE_FILE.exists():
+            try:
+                with open(ALERT_STATE_FILE, 'r') as f:
+                    state = json.load(f)
+            except json.JSONDecodeError:
+                # Left by a torn write from an older version; the averages rebuild from the database
+                return 0, {}
+            networks = {(n["room"], n["ssid"]): n for n in state.get("networks", [])}
+            return state.get("last_id", 0), networks
+        return 0, {}
     
-    def check_signal_degradation(self, room, ssid):
-        """Check if signal has degraded significantly"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get recent signals (last hour vs previous hour)
-        cutoff_recent = (datetime.now() - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
-        cutoff_previous = (datetime.now() - timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
-        
-        cursor.execute("""
-            SELECT AVG(signal) as avg_signal
-            FROM wifi_scans
-            WHERE room = ? AND ssid = ? AND timestamp >= ?
-        """, (room, ssid, cutoff_recent))
-        recent_avg = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT AVG(signal) as avg_signal
-            FROM wifi_scans
-            WHERE room = ? AND ssid = ? AND timestamp >= ? AND timestamp < ?
-        """, (room, ssid, cutoff_previous, cutoff_recent))
-        previous_avg = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        if recent_avg and previous_avg:
-            recent_dbm = recent_avg / 2.0 - 100.0
-            previous_dbm = previous_avg / 2.0 - 100.0
-            degradation = recent_dbm - previous_dbm
-            
-            if degradation < SIGNAL_DEGRADATION_THRESHOLD:
-                return self.add_alert(
-                    "signal_degradation",
-                    f"Signal degradation detected for {ssid} in {room}",
-                    severity="warning",
-                    data={
+    def save_state(self):
+        """Save the scan watermark and per-network running averages"""
+        write_atomic(ALERT_STATE_FILE, json.dumps({"last_id": self.last_id, "networks": list(self.networks.values())}))
+    
+    def update_running_averages(self):
+        """Fold scans newer than the watermark into the per-network running averages"""
+        with self.lock:
+            conn = get_connection()
+            cursor = conn.cursor()
+            
+            cutoff = (datetime.now() - timedelta(hours=STATE_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # A recreated database restarts ids below the watermark
+            max_id = cursor.execute("SELECT MAX(id) FROM wifi_scans").fetchone()[0] or 0
+            if max_id < self.last_id:
+                self.last_id, self.networks = 0, {}
+            
+            # Per-minute averages, oldest first, so the running averages evolve in
+            # time order. The timestamp bound skips old rows re-inserted by aggregate_old_data.
+            cursor.execute("""
+                SELECT room, ssid, AVG(signal_dbm), MAX(timestamp), MAX(id)
+                FROM wifi_scans
+                WHERE id > ? AND timestamp >= ?
+                GROUP BY room, ssid, substr(timestamp, 1, 16)
+                ORDER BY MAX(timestamp)
+            """, (self.last_id, cutoff))
+            rows = cursor.fetchall()
+            conn.close()
+            
+            for room, ssid, avg_dbm, seen, row_id in rows:
+                network = self.networks.get((room, ssid))
+                if network is None:
+                    self.networks[(room, ssid)] = {
                         "room": room,
                         "ssid": ssid,
-                        "previous_signal": round(previous_dbm, 1),
-                        "current_signal": round(recent_dbm, 1),
-                        "degradation": round(degradation, 1)
+                        "current": avg_dbm,
+                        "baseline": avg_dbm,
+                        "last_seen": seen
                     }
-                )
-        
-        return None
+                elif seen > network["last_seen"]:
+                    elapsed = (datetime.strptime(seen, "%Y-%m-%d %H:%M:%S")
+                               - datetime.strptime(network["last_seen"], "%Y-%m-%d %H:%M:%S")).total_seconds() / 60
+                    network["current"] += (1 - math.exp(-elapsed / CURRENT_EWMA_MINUTES)) * (avg_dbm - network["current"])
+                    network["baseline"] += (1 - math.exp(-elapsed / BASELINE_EWMA_MINUTES)) * (avg_dbm - network["baseline"])
+                    network["last_seen"] = seen
+                self.last_id = max(self.last_id, row_id)
+            
+            self.networks = {key: n for key, n in self.networks.items() if n["last_seen"] >= cutoff}
+            self.save_state()
+    
+    def add_alert(self, alert_type, message, severity="warning", data=None):
+        """Add a new alert"""
+        with self.lock:
+            alert = {
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "type": alert_type,
+                "message": message,
+                "severity": severity,
+                "data": data or {}
+            }
+            self.alerts.append(alert)
+            ALERTS_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(ALERTS_FILE, 'a') as f:
+                f.write(json.dumps(alert) + "\n")
+            return alert
+    
+    def check_signal_degradation(self, room=None, ssid=None):
+        """Check all (room, ssid) pairs, or a single pair, for significant signal degradation"""
+        with self.lock:
+            self.update_running_averages()
+            
+            cutoff_active = (datetime.now() - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+            
+            alerts = []
+            for network in self.networks.values():
+                if room is not None and ssid is not None and (network["room"], network["ssid"]) != (room, ssid):
+                    continue
+                if network["last_seen"] < cutoff_active:
+                    continue
+                
+                # Estimated drop, comparable with the old hour-over-hour difference
+                degradation = (network["current"] - network["baseline"]) / DEGRADATION_RESPONSE_PEAK
+                
+                if degradation < SIGNAL_DEGRADATION_THRESHOLD:
+                    alert = self.add_alert(
+                        "signal_degradation",
+                        f"Signal degradation detected for {network['ssid']} in {network['room']}",
+                        severity="warning",
+                        data={
+                            "room": network["room"],
+                            "ssid": network["ssid"],
+                            "previous_signal": round(network["baseline"], 1),
+                            "current_signal": round(network["current"], 1),
+                            "degradation": round(degradation, 1)
+                        }
+                    )
+                    alerts.append(alert)
+            
+            return alerts
     
     def check_poor_signal(self):
         """Check for networks with consistently poor signal"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cutoff = (datetime.now() - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
-        
-        cursor.execute("""
-            SELECT room, ssid, AVG(signal) as avg_signal
-            FROM wifi_scans
-            WHERE timestamp >= ?
-            GROUP BY room, ssid
-            HAVING avg_signal > 0
-        """, (cutoff,))
-        
-        alerts = []
-        for row in cursor.fetchall():
-            room, ssid, avg_signal = row
-            signal_dbm = avg_signal / 2.0 - 100.0
-            
-            if signal_dbm < POOR_SIGNAL_THRESHOLD:
+        with self.lock:
+            self.update_running_averages()
+            
+            cutoff_active = (datetime.now() - timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+            
+            alerts = []
+            for network in self.networks.values():
+                if network["last_seen"] < cutoff_active:
+                    continue
+                
+                if network["current"] < POOR_SIGNAL_THRESHOLD:
+                    alert = self.add_alert(
+                        "poor_signal",
+                        f"Poor signal detected for {network['ssid']} in {network['room']}",
+                        severity="info",
+                        data={
+                            "room": network["room"],
+                            "ssid": network["ssid"],
+                            "signal": round(network["current"], 1)
+                        }
+                    )
+                    alerts.append(alert)
+            
+            return alerts
+    
+    def check_network_disappearance(self):
+        """Check for networks that have disappeared"""
+        with self.lock:
+            self.update_running_averages()
+            
+            cutoff_recent = (datetime.now() - timedelta(minutes=NETWORK_DISAPPEARANCE_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # Networks seen in the retention window but not recently
+            alerts = []
+            for network in self.networks.values():
+                if network["last_seen"] >= cutoff_recent:
+                    continue
+                
                 alert = self.add_alert(
-                    "poor_signal",
-                    f"Poor signal detected for {ssid} in {room}",
-                    severity="info",
+                    "network_disappeared",
+                    f"Network {network['ssid']} not seen in {network['room']} for {NETWORK_DISAPPEARANCE_MINUTES} minutes",
+                    severity="warning",
                     data={
-                        "room": room,
-                        "ssid": ssid,
-                        "signal": round(signal_dbm, 1)
+                        "room": network["room"],
+                        "ssid": network["ssid"],
+                        "minutes_missing": NETWORK_DISAPPEARANCE_MINUTES
                     }
                 )
                 alerts.append(alert)
-        
-        conn.close()
-        return alerts
-    
-    def check_network_disappearance(self):
-        """Check for networks that have disappeared"""
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cutoff_recent = (datetime.now() - timedelta(minutes=NETWORK_DISAPPEARANCE_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
-        cutoff_old = (datetime.now() - timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Find networks seen in the past but not recently
-        cursor.execute("""
-            SELECT DISTINCT room, ssid
-            FROM wifi_scans
-            WHERE timestamp >= ? AND timestamp < ?
-            AND (room, ssid) NOT IN (
-                SELECT DISTINCT room, ssid
-                FROM wifi_scans
-                WHERE timestamp >= ?
-            )
-        """, (cutoff_old, cutoff_recent, cutoff_recent))
-        
-        alerts = []
-        for row in cursor.fetchall():
-            room, ssid = row
-            alert = self.add_alert(
-                "network_disappeared",
-                f"Network {ssid} not seen in {room} for {NETWORK_DISAPPEARANCE_MINUTES} minutes",
-                severity="warning",
-                data={
-                    "room": room,
-                    "ssid": ssid,
-                    "minutes_missing": NETWORK_DISAPPEARANCE_MINUTES
-                }
-            )
-            alerts.append(alert)
-        
-        conn.close()
-        return alerts
+            
+            return alerts
     
     def check_all(self):
         """Run all alert checks"""
-        alerts = []
-        
-        # Check for poor signals
-        alerts.extend(self.check_poor_signal())
-        
-        # Check for network disappearances
-        alerts.extend(self.check_network_disappearance())
-        
-        return alerts
+        with self.lock:
+            alerts = []
+            
+            # Check for signal drops across every room/network pair
+            alerts.extend(self.check_signal_degradation())
+            
+            # Check for poor signals
+            alerts.extend(self.check_poor_signal())
+            
+            # Check for network disappearances
+            alerts.extend(self.check_network_disappearance())
+            
+            return alerts
     
     def get_recent_alerts(self, hours=24):
         """Get alerts from last N hours"""
         cutoff = (datetime.now() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
-        return [alert for alert in self.alerts if alert["timestamp"] >= cutoff]
+        with self.lock:
+            return [alert for alert in self.alerts if alert["timestamp"] >= cutoff]
     
     def clear_old_alerts(self, days=7):
         """Remove alerts older than N days"""
-        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
-        self.alerts = [alert for alert in self.alerts if alert["timestamp"] >= cutoff]
-        self.save_alerts()
+        with self.lock:
+            cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+            self.alerts = [alert for alert in self.alerts if alert["timestamp"] >= cutoff]
+            self.save_alerts()
 
 
 def run_alert_checks():
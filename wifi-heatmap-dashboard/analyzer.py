@@ -1,9 +1,15 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Headless rendering; must be selected before any pyplot import
+from matplotlib.figure import Figure
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
 import json
@@ -15,40 +21,201 @@ OUTPUT_BARCHART = Path("static/barchart.png")
 OUTPUT_TRENDS = Path("static/trends.png")
 OUTPUT_CHANNEL = Path("static/channel_overlap.png")
 
-def load_all_data(hours_back=None):
-    """Load data from SQLite database with optional time filtering"""
+# Short-lived cache for load_all_data, keyed on (hours_back, newest row id)
+# so repeated loads reuse the DataFrame until new scans arrive
+LOAD_CACHE_TTL = 30  # seconds
+load_cache = {}
+load_cache_lock = threading.Lock()
+
+# Matplotlib figures are kept and cleared between renders instead of being
+# recreated; each has its own lock since Flask renders from several threads
+reusable_figures = {}
+reusable_figures_lock = threading.Lock()
+
+# Read connections are kept per thread instead of being opened per query
+MMAP_SIZE = 256 * 1024 * 1024  # bytes of the database file read through mmap
+READ_CACHE_KIB = 32768  # page cache per connection; several reader threads share a Pi Zero 2 W's 512 MB
+thread_local = threading.local()
+
+def get_connection():
+    """Open a database connection with per-connection pragmas applied"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # Keep GROUP BY / sort scratch space in RAM instead of temp files
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{READ_CACHE_KIB}")
+    return conn
+
+def get_conn():
+    """Return this thread's long-lived read connection, opening it on first use"""
+    conn = getattr(thread_local, 'conn', None)
+    if conn is None:
+        conn = get_connection()
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        thread_local.conn = conn
+    return conn
+
+@contextmanager
+def reusable_figure(name, figsize):
+    """Yield the long-lived Figure for `name`, cleared and held exclusively"""
+    with reusable_figures_lock:
+        if name not in reusable_figures:
+            reusable_figures[name] = (Figure(figsize=figsize), threading.Lock())
+        fig, lock = reusable_figures[name]
+    
+    with lock:
+        fig.clear()
+        yield fig
+
+def read_query(conn, query, params=()):
+    """Run a query and return the result as a DataFrame"""
+    cursor = conn.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+def get_cutoff_time(hours_back=None):
+    """Return the lower timestamp bound for a query (empty string matches all rows)"""
+    if not hours_back:
+        return ""
+    return (datetime.now() - timedelta(hours=hours_back)).strftime("%Y-%m-%d %H:%M:%S")
+
+def load_all_data(hours_back=None, conn=None):
+    """
+    Load data from SQLite database with optional time filtering.
+    Results are cached briefly and shared between callers, so treat the
+    returned DataFrame as read-only.
+    """
     if not DB_PATH.exists():
         raise ValueError(f"Database not found at {DB_PATH}")
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = conn or get_conn()
+    
+    # Cheap change check: the newest row id moves whenever the scanner inserts
+    max_id = conn.execute("SELECT MAX(id) FROM wifi_scans").fetchone()[0]
+    cache_key = (hours_back, max_id)
+    
+    with load_cache_lock:
+        entry = load_cache.get(cache_key)
+    if entry and time.monotonic() - entry[0] < LOAD_CACHE_TTL:
+        return entry[1]
     
     if hours_back:
         cutoff_time = (datetime.now() - timedelta(hours=hours_back)).strftime("%Y-%m-%d %H:%M:%S")
         query = """
-            SELECT timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor
+            SELECT timestamp, room, ssid, bssid, signal, signal_dbm, channel, frequency, security, vendor
             FROM wifi_scans
             WHERE timestamp >= ?
             ORDER BY timestamp
         """
-        df = pd.read_sql_query(query, conn, params=(cutoff_time,))
+        df = read_query(conn, query, (cutoff_time,))
     else:
         query = """
-            SELECT timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor
+            SELECT timestamp, room, ssid, bssid, signal, signal_dbm, channel, frequency, security, vendor
             FROM wifi_scans
             ORDER BY timestamp
         """
-        df = pd.read_sql_query(query, conn)
-    
-    conn.close()
+        df = read_query(conn, query)
     
     if df.empty:
         raise ValueError("No data found in database")
     
-    # Convert signal to numeric type first, then to dBm if needed
+    # signal_dbm is a generated column, already converted by SQLite
     df['signal'] = pd.to_numeric(df['signal'], errors='coerce').fillna(0)
-    df['signal_dbm'] = df['signal'].apply(lambda x: x / 2.0 - 100.0 if x > 0 else x)
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     
+    with load_cache_lock:
+        # Drop entries made stale by new scans or age before storing this one
+        now = time.monotonic()
+        for key in [k for k, (ts, _) in load_cache.items()
+                    if k[1] != max_id or now - ts >= LOAD_CACHE_TTL]:
+            del load_cache[key]
+        load_cache[cache_key] = (now, df)
+    
+    return df
+
+def get_latest(n=50, hours_back=1, conn=None):
+    """
+    Return the n most recent scans from the last hours_back hours as a list
+    of dicts, oldest first, without going through pandas.
+    """
+    if not DB_PATH.exists():
+        raise ValueError(f"Database not found at {DB_PATH}")
+    
+    cursor = (conn or get_conn()).cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute("""
+        SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp) AS timestamp, room, ssid, bssid,
+               COALESCE(signal, 0) AS signal, signal_dbm, channel, frequency, security, vendor
+        FROM wifi_scans
+        WHERE timestamp >= ?
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """, (get_cutoff_time(hours_back), n))
+    rows = [dict(row) for row in cursor.fetchall()]
+    
+    if not rows:
+        raise ValueError("No data found in database")
+    
+    rows.reverse()
+    return rows
+
+def has_rollup(conn):
+    """True when db_maintenance has created the hourly rollup tables"""
+    count = conn.execute("""
+        SELECT COUNT(*) FROM sqlite_master
+        WHERE type = 'table' AND name IN ('hourly_rollup', 'rollup_watermark')
+    """).fetchone()[0]
+    return count == 2
+
+def load_room_ssid_avg(hours_back=None, top_n=None, conn=None):
+    """
+    Load average signal (dBm) per room and SSID, aggregated in SQLite.
+    When top_n is given, only the top_n most frequently seen SSIDs are returned.
+    Returns a long-form DataFrame with columns room, ssid, avg_signal_dbm, scan_count.
+    """
+    if not DB_PATH.exists():
+        raise ValueError(f"Database not found at {DB_PATH}")
+    
+    cutoff_time = get_cutoff_time(hours_back)
+    conn = conn or get_conn()
+    
+    if has_rollup(conn):
+        # Whole hours come from hourly_rollup; only scans past the watermark are read raw
+        source = """
+            SELECT room, ssid, avg_signal * n AS total_dbm, n FROM hourly_rollup
+            WHERE hour >= substr(?, 1, 13)
+            UNION ALL
+            SELECT room, ssid, signal_dbm, 1 FROM wifi_scans
+            WHERE id > (SELECT last_id FROM rollup_watermark) AND timestamp >= ?
+        """
+        source_params = [cutoff_time, cutoff_time]
+    else:
+        source = "SELECT room, ssid, signal_dbm AS total_dbm, 1 AS n FROM wifi_scans WHERE timestamp >= ?"
+        source_params = [cutoff_time]
+    
+    query = f"""
+        WITH scans AS ({source})
+        SELECT room, ssid, SUM(total_dbm) / SUM(n) as avg_signal_dbm, SUM(n) as scan_count
+        FROM scans
+    """
+    params = list(source_params)
+    if top_n:
+        query += """
+            WHERE ssid IN (
+                SELECT ssid FROM scans
+                GROUP BY ssid
+                ORDER BY SUM(n) DESC
+                LIMIT ?
+            )
+        """
+        params.append(top_n)
+    query += " GROUP BY room, ssid"
+    
+    df = read_query(conn, query, params)
+    
+    if df.empty:
+        raise ValueError("No data found in database")
+    
     return df
 
 def calculate_room_averages(pivot_table: pd.DataFrame) -> dict:
@@ -68,88 +235,99 @@ def generate_time_series_trends(hours_back=24):
     top_ssids = df['ssid'].value_counts().head(5).index
     filtered = df[df['ssid'].isin(top_ssids)]
     
-    # Resample to 15-minute intervals for smoother trends
-    plt.figure(figsize=(10, 6))
+    # Resample every SSID to 15-minute means for smoother trends in one pass,
+    # one column per SSID in order of frequency
+    resampled = (
+        filtered.set_index('timestamp')
+        .groupby('ssid')['signal_dbm']
+        .resample('15min')
+        .mean()
+        .unstack(level=0)
+        .reindex(columns=top_ssids)
+    )
     
-    for ssid in top_ssids:
-        ssid_data = filtered[filtered['ssid'] == ssid].set_index('timestamp')
-        # Resample to 15min intervals and get mean
-        resampled = ssid_data['signal_dbm'].resample('15T').mean()
-        plt.plot(resampled.index, resampled.values, marker='o', label=ssid, linewidth=2)
-    
-    plt.title(f'Signal Strength Trends (Last {hours_back} Hours)')
-    plt.xlabel('Time')
-    plt.ylabel('Signal Strength (dBm)')
-    plt.legend(loc='best', fontsize=8)
-    plt.grid(True, alpha=0.3)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(OUTPUT_TRENDS)
-    plt.close()
+    with reusable_figure("trends", (10, 6)) as fig:
+        ax = fig.add_subplot()
+        
+        for ssid in resampled.columns:
+            ax.plot(resampled.index, resampled[ssid].values, marker='o', label=ssid, linewidth=2)
+        
+        ax.set_title(f'Signal Strength Trends (Last {hours_back} Hours)')
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Signal Strength (dBm)')
+        ax.legend(loc='best', fontsize=8)
+        ax.grid(True, alpha=0.3)
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
+        fig.savefig(OUTPUT_TRENDS)
     
     return OUTPUT_TRENDS
 
 
-def analyze_channel_overlap(hours_back=None):
+def analyze_channel_overlap(hours_back=None, conn=None):
     """Analyze 2.4GHz channel overlap and congestion"""
-    df = load_all_data(hours_back=hours_back)
+    if not DB_PATH.exists():
+        raise ValueError(f"Database not found at {DB_PATH}")
     
-    # Convert channel to numeric and filter for 2.4GHz channels (1-14)
-    df['channel'] = pd.to_numeric(df['channel'], errors='coerce')
-    df_24ghz = df[df['channel'].notna() & (df['channel'] >= 1) & (df['channel'] <= 14)].copy()
+    cutoff_time = get_cutoff_time(hours_back)
+    conn = conn or get_conn()
     
-    if df_24ghz.empty:
+    # Only the per-channel counts leave SQLite; 2.4GHz is channels 1-14
+    total_scans, total_networks_24ghz = conn.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT CASE WHEN channel BETWEEN 1 AND 14 THEN ssid END)
+        FROM wifi_scans
+        WHERE timestamp >= ?
+    """, (cutoff_time,)).fetchone()
+    
+    if total_scans == 0:
+        raise ValueError("No data found in database")
+    if total_networks_24ghz == 0:
         return None, {"message": "No 2.4GHz channel data available"}
     
     # Count networks per channel
-    channel_counts = df_24ghz.groupby('channel').agg({
-        'ssid': 'nunique',
-        'signal_dbm': 'mean'
-    }).reset_index()
-    channel_counts.columns = ['channel', 'network_count', 'avg_signal']
+    channel_counts = conn.execute("""
+        SELECT CAST(channel AS INTEGER), COUNT(DISTINCT ssid)
+        FROM wifi_scans
+        WHERE timestamp >= ? AND channel BETWEEN 1 AND 14
+        GROUP BY 1
+    """, (cutoff_time,)).fetchall()
     
-    # Create visualization
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    
-    # Channel congestion bar chart
     channels = range(1, 15)
-    counts = [channel_counts[channel_counts['channel'] == ch]['network_count'].values[0] 
-              if ch in channel_counts['channel'].values else 0 for ch in channels]
-    
-    colors = ['red' if c > 5 else 'orange' if c > 3 else 'green' for c in counts]
-    ax1.bar(channels, counts, color=colors, alpha=0.7)
-    ax1.set_xlabel('Channel')
-    ax1.set_ylabel('Number of Networks')
-    ax1.set_title('2.4GHz Channel Congestion')
-    ax1.set_xticks(channels)
-    ax1.grid(True, alpha=0.3)
+    counts = np.zeros(14, dtype=int)
+    for channel, network_count in channel_counts:
+        counts[channel - 1] = network_count
     
     # Channel overlap visualization (channels 1-11 overlap pattern)
-    overlap_matrix = []
-    for ch in range(1, 12):
-        overlaps = []
-        for other_ch in range(1, 12):
-            # Channels overlap if within 4 channels of each other
-            if abs(ch - other_ch) <= 4:
-                overlap_count = counts[ch-1] + counts[other_ch-1]
-                overlaps.append(overlap_count if ch != other_ch else counts[ch-1])
-            else:
-                overlaps.append(0)
-        overlap_matrix.append(overlaps)
-    
-    im = ax2.imshow(overlap_matrix, aspect='auto', cmap='YlOrRd')
-    ax2.set_xlabel('Channel')
-    ax2.set_ylabel('Channel')
-    ax2.set_title('Channel Overlap Interference Map')
-    ax2.set_xticks(range(11))
-    ax2.set_xticklabels(range(1, 12))
-    ax2.set_yticks(range(11))
-    ax2.set_yticklabels(range(1, 12))
-    plt.colorbar(im, ax=ax2, label='Interference Level')
-    
-    plt.tight_layout()
-    plt.savefig(OUTPUT_CHANNEL)
-    plt.close()
+    # Channels overlap if within 4 channels of each other
+    i, j = np.indices((11, 11))
+    overlap_matrix = np.where(np.abs(i - j) <= 4, counts[i] + counts[j], 0)
+    np.fill_diagonal(overlap_matrix, counts[:11])
+    
+    # Create visualization
+    with reusable_figure("channel", (10, 8)) as fig:
+        ax1, ax2 = fig.subplots(2, 1)
+        
+        # Channel congestion bar chart
+        colors = ['red' if c > 5 else 'orange' if c > 3 else 'green' for c in counts]
+        ax1.bar(channels, counts, color=colors, alpha=0.7)
+        ax1.set_xlabel('Channel')
+        ax1.set_ylabel('Number of Networks')
+        ax1.set_title('2.4GHz Channel Congestion')
+        ax1.set_xticks(channels)
+        ax1.grid(True, alpha=0.3)
+        
+        im = ax2.imshow(overlap_matrix, aspect='auto', cmap='YlOrRd')
+        ax2.set_xlabel('Channel')
+        ax2.set_ylabel('Channel')
+        ax2.set_title('Channel Overlap Interference Map')
+        ax2.set_xticks(range(11))
+        ax2.set_xticklabels(range(1, 12))
+        ax2.set_yticks(range(11))
+        ax2.set_yticklabels(range(1, 12))
+        fig.colorbar(im, ax=ax2, label='Interference Level')
+        
+        fig.tight_layout()
+        fig.savefig(OUTPUT_CHANNEL)
     
     # Recommend best channels (1, 6, 11 are non-overlapping)
     non_overlap_channels = [1, 6, 11]
@@ -159,27 +337,68 @@ def analyze_channel_overlap(hours_back=None):
         "best_channel": int(best_channel),
         "channel_usage": {int(ch): int(counts[ch-1]) for ch in channels},
         "non_overlapping_channels": non_overlap_channels,
-        "total_networks_24ghz": int(df_24ghz['ssid'].nunique())
+        "total_networks_24ghz": int(total_networks_24ghz)
     }
     
     return OUTPUT_CHANNEL, recommendations
 
 
-def get_network_statistics(hours_back=None):
+def get_network_statistics(hours_back=None, conn=None):
     """Get comprehensive network statistics"""
-    df = load_all_data(hours_back=hours_back)
+    if not DB_PATH.exists():
+        raise ValueError(f"Database not found at {DB_PATH}")
+    
+    cutoff_time = get_cutoff_time(hours_back)
+    cursor = (conn or get_conn()).cursor()
+    
+    cursor.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT ssid), COUNT(DISTINCT room), MIN(timestamp), MAX(timestamp)
+        FROM wifi_scans
+        WHERE timestamp >= ?
+    """, (cutoff_time,))
+    total_scans, unique_networks, unique_rooms, start, end = cursor.fetchone()
+    
+    if total_scans == 0:
+        raise ValueError("No data found in database")
+    
+    cursor.execute("""
+        SELECT ssid, COUNT(*) as c
+        FROM wifi_scans
+        WHERE timestamp >= ?
+        GROUP BY ssid
+        ORDER BY c DESC
+        LIMIT 10
+    """, (cutoff_time,))
+    top_networks = dict(cursor.fetchall())
+    
+    cursor.execute("""
+        SELECT security, COUNT(*) as c
+        FROM wifi_scans
+        WHERE timestamp >= ? AND security IS NOT NULL
+        GROUP BY security
+        ORDER BY c DESC
+    """, (cutoff_time,))
+    security_types = dict(cursor.fetchall())
+    
+    cursor.execute("""
+        SELECT room, AVG(signal_dbm)
+        FROM wifi_scans
+        WHERE timestamp >= ?
+        GROUP BY room
+    """, (cutoff_time,))
+    avg_signal_by_room = dict(cursor.fetchall())
     
     stats = {
-        "total_scans": len(df),
-        "unique_networks": df['ssid'].nunique(),
-        "unique_rooms": df['room'].nunique(),
+        "total_scans": total_scans,
+        "unique_networks": unique_networks,
+        "unique_rooms": unique_rooms,
         "date_range": {
-            "start": df['timestamp'].min().strftime("%Y-%m-%d %H:%M:%S"),
-            "end": df['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S")
+            "start": start,
+            "end": end
         },
-        "top_networks": df['ssid'].value_counts().head(10).to_dict(),
-        "security_types": df['security'].value_counts().to_dict() if 'security' in df.columns else {},
-        "avg_signal_by_room": df.groupby('room')['signal_dbm'].mean().to_dict()
+        "top_networks": top_networks,
+        "security_types": security_types,
+        "avg_signal_by_room": avg_signal_by_room
     }
     
     return stats
@@ -187,64 +406,46 @@ def get_network_statistics(hours_back=None):
 
 def generate_heatmap(hours_back=None):
     """Generate static heatmap visualization"""
-    df = load_all_data(hours_back=hours_back)
-
-    top_ssids = df["ssid"].value_counts().head(6).index
-    filtered = df[df["ssid"].isin(top_ssids)]
-
-    pivot = filtered.pivot_table(
-        index="room",
-        columns="ssid",
-        values="signal_dbm",
-        aggfunc="mean"
-    )
+    agg_df = load_room_ssid_avg(hours_back=hours_back, top_n=6)
+    pivot = agg_df.pivot(index="room", columns="ssid", values="avg_signal_dbm")
 
     room_average_data = calculate_room_averages(pivot)
 
-    plt.figure(figsize=(8, 5))
-    plt.imshow(pivot.values, aspect="auto", cmap='RdYlGn')
-    plt.xticks(range(len(pivot.columns)), list(pivot.columns), rotation=45, ha="right")
-    plt.yticks(range(len(pivot.index)), list(pivot.index))
-    plt.colorbar(label="Signal Strength (dBm)")
-    plt.title("WiFi Signal Heatmap (Room vs Network)")
-    plt.tight_layout()
+    with reusable_figure("heatmap", (8, 5)) as fig:
+        ax = fig.add_subplot()
+        im = ax.imshow(pivot.values, aspect="auto", cmap='RdYlGn')
+        ax.set_xticks(range(len(pivot.columns)), list(pivot.columns), rotation=45, ha="right")
+        ax.set_yticks(range(len(pivot.index)), list(pivot.index))
+        fig.colorbar(im, ax=ax, label="Signal Strength (dBm)")
+        ax.set_title("WiFi Signal Heatmap (Room vs Network)")
+        fig.tight_layout()
 
-    plt.savefig(OUTPUT_HEATMAP)
-    plt.close()
+        fig.savefig(OUTPUT_HEATMAP)
 
     # -------- BAR CHART (Average signal per room) --------
 
-    plt.figure(figsize=(6, 4))
+    with reusable_figure("barchart", (6, 4)) as fig:
+        ax = fig.add_subplot()
 
-    rooms = list(room_average_data.keys())
-    values = list(room_average_data.values())
+        rooms = list(room_average_data.keys())
+        values = list(room_average_data.values())
 
-    plt.bar(rooms, values, color='steelblue')
-    plt.title("Average Signal Strength Per Room")
-    plt.xlabel("Room")
-    plt.ylabel("Signal Strength (dBm)")
-    plt.xticks(rotation=20)
-    plt.tight_layout()
+        ax.bar(rooms, values, color='steelblue')
+        ax.set_title("Average Signal Strength Per Room")
+        ax.set_xlabel("Room")
+        ax.set_ylabel("Signal Strength (dBm)")
+        ax.tick_params(axis='x', labelrotation=20)
+        fig.tight_layout()
 
-    plt.savefig(OUTPUT_BARCHART)
-    plt.close()
+        fig.savefig(OUTPUT_BARCHART)
 
     return OUTPUT_HEATMAP, OUTPUT_BARCHART, room_average_data
 
 
 def generate_interactive_heatmap(hours_back=None):
     """Generate interactive Plotly heatmap"""
-    df = load_all_data(hours_back=hours_back)
-    
-    top_ssids = df["ssid"].value_counts().head(10).index
-    filtered = df[df["ssid"].isin(top_ssids)]
-    
-    pivot = filtered.pivot_table(
-        index="room",
-        columns="ssid",
-        values="signal_dbm",
-        aggfunc="mean"
-    )
+    agg_df = load_room_ssid_avg(hours_back=hours_back, top_n=10)
+    pivot = agg_df.pivot(index="room", columns="ssid", values="avg_signal_dbm")
     
     fig = go.Figure(data=go.Heatmap(
         z=pivot.values,
@@ -278,8 +479,10 @@ def generate_interactive_trends(hours_back=24):
     
     fig = go.Figure()
     
+    # Split by SSID in a single grouping pass
+    grouped = filtered.groupby('ssid')
     for ssid in top_ssids:
-        ssid_data = filtered[filtered['ssid'] == ssid]
+        ssid_data = grouped.get_group(ssid)
         fig.add_trace(go.Scatter(
             x=ssid_data['timestamp'],
             y=ssid_data['signal_dbm'],
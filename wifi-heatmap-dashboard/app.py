@@ -6,102 +6,280 @@ from analyzer import (
     get_network_statistics,
     generate_interactive_heatmap,
     generate_interactive_trends,
-    load_all_data
+    get_latest,
+    get_connection
 )
 from alerts import AlertSystem, run_alert_checks
+from db_maintenance import DB_PATH, ROLLUP_INTERVAL, ensure_indexes, aggregate_incremental
 import json
+import gzip
+import hashlib
 import time
-from datetime import datetime, timedelta
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# watchdog is optional: with it, the live stream wakes on writes to the
+# database's WAL file instead of re-querying every few seconds
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# orjson is optional: it encodes API responses in C, otherwise jsonify is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# waitress is optional: a production WSGI server for the dashboard,
+# otherwise Flask's built-in server is used in threaded mode
+try:
+    from waitress import serve as waitress_serve
+except ImportError:
+    waitress_serve = None
 
 app = Flask(__name__)
 
-# Enhanced cache with timestamps
+# Enhanced cache with timestamps; the lock ensures only one regeneration per key
 cache = {
-    'static_dashboard': {'timestamp': None, 'data': None},
-    'interactive_dashboard': {'timestamp': None, 'data': None},
-    'stats': {'timestamp': None, 'data': None}
+    key: {'timestamp': None, 'data': None, 'lock': threading.Lock(), 'refreshing': False}
+    for key in ('static_dashboard', 'interactive_dashboard', 'stats')
 }
 
 # Cache duration in seconds
 CACHE_DURATION = 60  # 1 minute
 
+# Analyzer results shared between the two dashboards, keyed on (function, hours_back)
+result_cache = {}
+result_cache_lock = threading.Lock()
+
+# Runs a dashboard's independent analyzer calls side by side; the workers are
+# long-lived so each keeps its own analyzer read connection
+dashboard_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dashboard")
+
+# Live stream: one background poller fans new scans out to every SSE client
+STREAM_POLL_INTERVAL = 5  # seconds, without change notifications
+STREAM_WAIT_TIMEOUT = 30  # seconds, safety re-check when notifications are active
+STREAM_SETTLE_DELAY = 0.25  # seconds for a writer to finish its commit after WAL activity
+STREAM_QUEUE_SIZE = 100  # Per-client backlog before updates are dropped
+STREAM_KEEPALIVE_INTERVAL = 15  # seconds; a write to a closed socket ends the client's generator
+STREAM_MAX_CLIENTS = 4  # Each client holds a server thread; leave the rest for page and API requests
+LATEST_SCAN_QUERY = """
+    SELECT timestamp, room, ssid, bssid, signal, signal_dbm, channel, frequency, security, vendor
+    FROM wifi_scans
+    WHERE rowid = ?
+"""
+stream_clients = set()
+stream_clients_lock = threading.Lock()
+stream_poller = None
+stream_observer = None
+latest_scan = None
+db_changed = threading.Event()
+
+# WAL lets dashboard reads run alongside the scanner's writes; the mode
+# persists in the file. Also make sure the time-window indexes exist.
+if DB_PATH.exists():
+    admin_conn = sqlite3.connect(DB_PATH)
+    admin_conn.execute("PRAGMA journal_mode=WAL")
+    ensure_indexes(admin_conn)
+    admin_conn.close()
+
+def run_rollups():
+    """Keep the hourly rollup table current for the heatmaps"""
+    while True:
+        try:
+            aggregate_incremental()
+        except Exception as e:
+            print(f"Hourly rollup failed: {e}")
+        time.sleep(ROLLUP_INTERVAL)
+
+
+rollup_worker = None
+rollup_worker_lock = threading.Lock()
+
+
+@app.before_request
+def start_rollup_worker():
+    """Start the rollup thread with the first request, not at import"""
+    global rollup_worker
+    if rollup_worker is not None:
+        return
+    with rollup_worker_lock:
+        if rollup_worker is None:
+            rollup_worker = threading.Thread(target=run_rollups, daemon=True)
+            rollup_worker.start()
+
+
 # Initialize alert system
 alert_system = AlertSystem()
 
+def ojson(data):
+    """JSON response for the API endpoints"""
+    if orjson is None:
+        return jsonify(data)
+    # Channel usage maps are keyed by int, which jsonify also stringifies
+    return Response(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY),
+                    mimetype='application/json')
+
+
 def is_cache_valid(cache_key):
-    """Check if cache is still valid"""
-    if cache[cache_key]['timestamp'] is None:
-        return False
-    age = (datetime.now() - cache[cache_key]['timestamp']).total_seconds()
-    return age < CACHE_DURATION
+    """Return (valid, stale_ok): fresh data, or expired data that can still be served"""
+    entry = cache[cache_key]
+    if entry['timestamp'] is None:
+        return False, False
+    age = time.monotonic() - entry['timestamp']
+    return age < CACHE_DURATION, entry['data'] is not None
+
+
+def cached_result(func, hours_back=None):
+    """Call an analyzer function, reusing its result for CACHE_DURATION"""
+    key = (func.__name__, hours_back)
+    with result_cache_lock:
+        entry = result_cache.get(key)
+    if entry and time.monotonic() - entry[0] < CACHE_DURATION:
+        return entry[1]
+    
+    result = func(hours_back=hours_back)
+    with result_cache_lock:
+        result_cache[key] = (time.monotonic(), result)
+    return result
+
+
+def store_cache(cache_key, data):
+    """Record freshly generated data for a cache key"""
+    cache[cache_key]['data'] = data
+    cache[cache_key]['timestamp'] = time.monotonic()
+
+
+def refresh_cache(cache_key, generate):
+    """Regenerate a cache entry in the background; caller holds the entry's lock"""
+    entry = cache[cache_key]
+    try:
+        with app.app_context():
+            store_cache(cache_key, generate())
+    except Exception as e:
+        # Keep serving the stale copy; the next request retries
+        print(f"Background refresh of {cache_key} failed: {e}")
+    finally:
+        entry['refreshing'] = False
+        entry['lock'].release()
+
+
+def get_cached(cache_key, generate):
+    """Serve from cache, regenerating at most once per key (stale-while-revalidate)"""
+    entry = cache[cache_key]
+    valid, stale_ok = is_cache_valid(cache_key)
+    if valid:
+        return entry['data']
+    
+    if stale_ok:
+        # Serve the expired copy now; one thread regenerates it
+        if entry['lock'].acquire(blocking=False):
+            entry['refreshing'] = True
+            threading.Thread(target=refresh_cache, args=(cache_key, generate), daemon=True).start()
+        return entry['data']
+    
+    # Nothing to serve yet: the first caller generates, the rest wait for it
+    with entry['lock']:
+        if is_cache_valid(cache_key)[1]:
+            return entry['data']
+        data = generate()
+        store_cache(cache_key, data)
+        return data
+
+def compress_page(html):
+    """Encode a rendered page once: raw and gzip bodies plus a content ETag"""
+    body = html.encode('utf-8')
+    return {'body': body, 'gzip': gzip.compress(body), 'etag': hashlib.md5(body).hexdigest()}
+
+
+def page_response(page):
+    """Serve a pre-encoded page, gzipped when accepted; 304 if the client's copy matches"""
+    use_gzip = request.accept_encodings.quality('gzip') > 0
+    etag = page['etag'] + ('-gz' if use_gzip else '')
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(page['gzip'] if use_gzip else page['body'], mimetype='text/html')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    # Let browsers keep the page but revalidate it on every visit
+    response.cache_control.no_cache = True
+    return response
+
+
+def build_static_dashboard():
+    """Render the static (matplotlib) dashboard"""
+    print("Generating new static dashboard...")
+
+    # Generate static visualizations (limit data to last 7 days for performance)
+    heatmap_future = dashboard_executor.submit(generate_heatmap, hours_back=168)  # 7 days
+    trends_future = dashboard_executor.submit(generate_time_series_trends, hours_back=24)
+    channel_future = dashboard_executor.submit(cached_result, analyze_channel_overlap, hours_back=168)  # 7 days
+    stats_future = dashboard_executor.submit(cached_result, get_network_statistics, hours_back=168)  # 7 days
+    
+    heatmap_path, barchart_path, room_averages = heatmap_future.result()
+    trends_path = trends_future.result()
+    channel_path, channel_recs = channel_future.result()
+    stats = stats_future.result()
+
+    return compress_page(render_template(
+        "index.html",
+        heatmap=str(heatmap_path),
+        barchart=str(barchart_path),
+        trends=str(trends_path) if trends_path else None,
+        channel=str(channel_path) if channel_path else None,
+        averages=room_averages,
+        channel_recs=channel_recs,
+        stats=stats
+    ))
+
 
 @app.route("/")
 def index():
     try:
-        # Check cache first
-        if is_cache_valid('static_dashboard'):
-            print("Using cached static dashboard")
-            return cache['static_dashboard']['data']
-        
-        print("Generating new static dashboard...")
-        
-        # Generate static visualizations (limit data to last 7 days for performance)
-        heatmap_path, barchart_path, room_averages = generate_heatmap(hours_back=168)  # 7 days
-        trends_path = generate_time_series_trends(hours_back=24)
-        channel_path, channel_recs = analyze_channel_overlap(hours_back=168)  # 7 days
-        
-        stats = get_network_statistics(hours_back=168)  # 7 days
-
-        result = render_template(
-            "index.html",
-            heatmap=str(heatmap_path),
-            barchart=str(barchart_path),
-            trends=str(trends_path) if trends_path else None,
-            channel=str(channel_path) if channel_path else None,
-            averages=room_averages,
-            channel_recs=channel_recs,
-            stats=stats
-        )
-        
-        # Cache the result
-        cache['static_dashboard']['data'] = result
-        cache['static_dashboard']['timestamp'] = datetime.now()
-        
-        return result
+        return page_response(get_cached('static_dashboard', build_static_dashboard))
     except Exception as e:
         return f"<h2>Error generating dashboard</h2><p>{str(e)}</p><pre>{repr(e)}</pre>"
 
 
+def build_interactive_dashboard():
+    """Render the interactive (Plotly) dashboard"""
+    print("Generating new interactive dashboard...")
+    
+    heatmap_future = dashboard_executor.submit(generate_interactive_heatmap, hours_back=168)  # 7 days
+    trends_future = dashboard_executor.submit(generate_interactive_trends, hours_back=24)
+    stats_future = dashboard_executor.submit(cached_result, get_network_statistics, hours_back=168)  # 7 days
+    channel_future = dashboard_executor.submit(cached_result, analyze_channel_overlap, hours_back=168)  # 7 days
+    
+    heatmap_html = heatmap_future.result()
+    trends_html = trends_future.result()
+    stats = stats_future.result()
+    channel_path, channel_recs = channel_future.result()
+    
+    return compress_page(render_template(
+        "interactive.html",
+        heatmap_html=heatmap_html,
+        trends_html=trends_html,
+        stats=stats,
+        channel=str(channel_path) if channel_path else None,
+        channel_recs=channel_recs
+    ))
+
+
 @app.route("/interactive")
 def interactive_view():
     """Interactive dashboard with Plotly charts"""
     try:
-        # Check cache first
-        if is_cache_valid('interactive_dashboard'):
-            print("Using cached interactive dashboard")
-            return cache['interactive_dashboard']['data']
-        
-        print("Generating new interactive dashboard...")
-        
-        heatmap_html = generate_interactive_heatmap(hours_back=168)  # 7 days
-        trends_html = generate_interactive_trends(hours_back=24)
-        stats = get_network_statistics(hours_back=168)  # 7 days
-        channel_path, channel_recs = analyze_channel_overlap(hours_back=168)  # 7 days
-        
-        result = render_template(
-            "interactive.html",
-            heatmap_html=heatmap_html,
-            trends_html=trends_html,
-            stats=stats,
-            channel=str(channel_path) if channel_path else None,
-            channel_recs=channel_recs
-        )
-        
-        # Cache the result
-        cache['interactive_dashboard']['data'] = result
-        cache['interactive_dashboard']['timestamp'] = datetime.now()
-        
-        return result
+        return page_response(get_cached('interactive_dashboard', build_interactive_dashboard))
     except Exception as e:
         return f"<h2>Error generating interactive dashboard</h2><p>{str(e)}</p>"
 
@@ -110,68 +288,143 @@ def interactive_view():
 def api_stats():
     """API endpoint for statistics"""
     try:
-        # Check cache first
-        if is_cache_valid('stats'):
-            return jsonify(cache['stats']['data'])
-        
-        stats = get_network_statistics(hours_back=168)  # 7 days
-        
-        # Cache the result
-        cache['stats']['data'] = stats
-        cache['stats']['timestamp'] = datetime.now()
-        
-        return jsonify(stats)
+        stats = get_cached('stats', lambda: cached_result(get_network_statistics, hours_back=168))  # 7 days
+        return ojson(stats)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}), 500
 
 
 @app.route("/api/clear_cache", methods=["POST"])
 def clear_cache():
     """Clear all caches and force regeneration"""
-    cache['static_dashboard'] = {'timestamp': None, 'data': None}
-    cache['interactive_dashboard'] = {'timestamp': None, 'data': None}
-    cache['stats'] = {'timestamp': None, 'data': None}
-    return jsonify({"success": True, "message": "Cache cleared"})
+    for entry in cache.values():
+        entry['timestamp'] = None
+        entry['data'] = None
+    with result_cache_lock:
+        result_cache.clear()
+    return ojson({"success": True, "message": "Cache cleared"})
 
 
 @app.route("/api/latest")
 def api_latest():
     """API endpoint for latest scan data"""
     try:
-        df = load_all_data(hours_back=1)
-        latest = df.tail(50).to_dict('records')
-        
-        # Convert timestamps to strings
-        for record in latest:
-            if 'timestamp' in record:
-                record['timestamp'] = record['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-        
-        return jsonify(latest)
+        return ojson(get_latest(n=50, hours_back=1))
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}), 500
+
+
+def publish_stream_event(data):
+    """Queue an SSE payload for every connected client"""
+    with stream_clients_lock:
+        for client_queue in stream_clients:
+            try:
+                client_queue.put_nowait(data)
+            except queue.Full:
+                # Slow client; it will catch up with the next scan
+                pass
+
+
+class WalChangeHandler(FileSystemEventHandler):
+    """Wakes the stream poller whenever a writer touches the WAL file"""
+
+    def __init__(self, wal_path):
+        super().__init__()
+        self.wal_path = str(wal_path)
+
+    def on_modified(self, event):
+        if event.src_path == self.wal_path:
+            db_changed.set()
+
+    on_created = on_modified
+
+
+def watch_wal_file():
+    """Start a watchdog observer on the WAL file; returns None if unavailable"""
+    if Observer is None:
+        return None
+    
+    try:
+        observer = Observer()
+        observer.schedule(WalChangeHandler(DB_PATH.with_name(DB_PATH.name + "-wal")),
+                          str(DB_PATH.parent), recursive=False)
+        observer.daemon = True
+        observer.start()
+        return observer
+    except Exception as e:
+        print(f"WAL watch unavailable, polling instead: {e}")
+        return None
+
+
+def poll_latest_scan():
+    """Watch MAX(rowid) and publish the newest scan whenever it changes"""
+    global latest_scan
+    conn = None
+    last_rowid = None
+    wait_timeout = STREAM_WAIT_TIMEOUT if stream_observer is not None else STREAM_POLL_INTERVAL
+    while True:
+        # Clear before querying so a write landing mid-query triggers another pass
+        db_changed.clear()
+        try:
+            if conn is None:
+                conn = get_connection()
+                conn.row_factory = sqlite3.Row
+            
+            max_rowid = conn.execute("SELECT MAX(rowid) FROM wifi_scans").fetchone()[0]
+            if max_rowid is not None and max_rowid != last_rowid:
+                row = conn.execute(LATEST_SCAN_QUERY, (max_rowid,)).fetchone()
+                if row is not None:
+                    with stream_clients_lock:
+                        latest_scan = dict(row)
+                    publish_stream_event(latest_scan)
+                last_rowid = max_rowid
+        except Exception as e:
+            publish_stream_event({'error': str(e)})
+            if conn is not None:
+                conn.close()
+                conn = None
+        
+        if db_changed.wait(timeout=wait_timeout):
+            # WAL pages are written before the commit becomes visible; this
+            # also folds the burst of events from one commit into one query
+            time.sleep(STREAM_SETTLE_DELAY)
+
+
+def start_stream_poller():
+    """Start the shared poller thread on first use"""
+    global stream_poller, stream_observer
+    with stream_clients_lock:
+        if stream_poller is None:
+            stream_observer = watch_wal_file()
+            stream_poller = threading.Thread(target=poll_latest_scan, daemon=True)
+            stream_poller.start()
 
 
 @app.route("/stream")
 def stream():
     """Server-Sent Events endpoint for real-time updates"""
+    start_stream_poller()
+    
+    client_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    with stream_clients_lock:
+        if len(stream_clients) >= STREAM_MAX_CLIENTS:
+            return Response("Too many live stream clients", status=503, headers={"Retry-After": "30"})
+        stream_clients.add(client_queue)
+        # New clients start from the most recent scan
+        if latest_scan is not None:
+            client_queue.put_nowait(latest_scan)
+    
     def event_stream():
-        last_count = 0
-        while True:
-            try:
-                df = load_all_data(hours_back=1)
-                current_count = len(df)
-                
-                if current_count != last_count:
-                    latest_data = df.tail(1).to_dict('records')[0]
-                    latest_data['timestamp'] = latest_data['timestamp'].strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    yield f"data: {json.dumps(latest_data)}\n\n"
-                    last_count = current_count
-                
-                time.sleep(5)
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                time.sleep(5)
+        try:
+            while True:
+                try:
+                    yield f"data: {json.dumps(client_queue.get(timeout=STREAM_KEEPALIVE_INTERVAL))}\n\n"
+                except queue.Empty:
+                    # SSE comment line, ignored by EventSource
+                    yield ": keepalive\n\n"
+        finally:
+            with stream_clients_lock:
+                stream_clients.discard(client_queue)
     
     return Response(event_stream(), mimetype="text/event-stream")
 
@@ -180,10 +433,10 @@ def stream():
 def api_channel_recommendations():
     """API endpoint for channel recommendations"""
     try:
-        _, recommendations = analyze_channel_overlap()
-        return jsonify(recommendations)
+        _, recommendations = cached_result(analyze_channel_overlap)
+        return ojson(recommendations)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}), 500
 
 
 @app.route("/api/alerts")
@@ -192,9 +445,9 @@ def api_alerts():
     try:
         hours = request.args.get('hours', 24, type=int)
         alerts = alert_system.get_recent_alerts(hours=hours)
-        return jsonify({"alerts": alerts, "count": len(alerts)})
+        return ojson({"alerts": alerts, "count": len(alerts)})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}), 500
 
 
 @app.route("/api/alerts/check")
@@ -202,9 +455,9 @@ def api_check_alerts():
     """API endpoint to trigger alert checks"""
     try:
         new_alerts = alert_system.check_all()
-        return jsonify({"new_alerts": new_alerts, "count": len(new_alerts)})
+        return ojson({"new_alerts": new_alerts, "count": len(new_alerts)})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return ojson({"error": str(e)}), 500
 
 
 @app.route("/alerts")
@@ -217,5 +470,14 @@ def alerts_page():
         return f"<h2>Error loading alerts</h2><p>{str(e)}</p>"
 
 
+def run_server():
+    """Serve the dashboard on port 5000"""
+    if waitress_serve is not None:
+        # Each /stream client holds a worker thread while connected (at most STREAM_MAX_CLIENTS)
+        waitress_serve(app, host="0.0.0.0", port=5000, threads=8)
+    else:
+        app.run(host="0.0.0.0", port=5000, debug=False, threaded=True)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
+    run_server()
@@ -4,16 +4,37 @@ Database Maintenance Script
 Manage, cleanup, and optimize the WiFi analyzer database
 """
 
+import csv
 import sqlite3
 import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
 
 DB_PATH = Path(__file__).parent / "data" / "wifi_data.db"
+EXPORT_CHUNK_SIZE = 100_000  # Rows per chunk when exporting to CSV
+IMPORT_PROGRESS_INTERVAL = 100_000  # Rows between import progress updates
+IMPORT_COLUMNS = ['timestamp', 'room', 'ssid', 'bssid', 'signal', 'channel', 'frequency', 'security', 'vendor']
+DELETE_BATCH_SIZE = 10_000  # Rows per cleanup transaction, so the scanner is never blocked for long
+ROLLUP_INTERVAL = 300  # Seconds between incremental rollups in the dashboard
+ROLLUP_BATCH_SIZE = 10_000  # Scans folded per rollup transaction, so the scanner is never blocked for long
+PAGE_SIZE = 8192  # bytes; fewer, larger reads on the SD card for the long scans
+CACHE_SIZE_KIB = 65536  # Page cache per maintenance connection (fits a Pi Zero 2 W's 512 MB)
+
+# Raw 0-100 signal to dBm; must match SIGNAL_DBM_EXPR in wifi-collector/scanner.py
+SIGNAL_DBM_EXPR = "CASE WHEN signal > 0 THEN signal / 2.0 - 100.0 ELSE COALESCE(signal, 0) END"
+
+def get_connection(isolation_level=""):
+    """Open a database connection with per-connection pragmas applied"""
+    conn = sqlite3.connect(DB_PATH, isolation_level=isolation_level)
+    # Keep GROUP BY / sort scratch space in RAM instead of temp files
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    return conn
+
 
 def get_stats():
     """Get database statistics"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Total records
@@ -48,9 +69,9 @@ def get_stats():
     print("=" * 50)
 
 
-def cleanup_old_data(days):
+def cleanup_old_data(days, assume_yes=False):
     """Remove data older than specified days"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
@@ -65,17 +86,37 @@ def cleanup_old_data(days):
         return
     
     print(f"🗑️  Found {count:,} records older than {days} days")
-    confirm = input("Delete these records? (yes/no): ")
+    confirm = 'yes' if assume_yes else input("Delete these records? (yes/no): ")
     
     if confirm.lower() == 'yes':
-        cursor.execute("DELETE FROM wifi_scans WHERE timestamp < ?", (cutoff_date,))
+        # Drop the rolled-up hours first so the heatmaps stop showing them
+        trim_rollup(conn, cutoff_date)
         conn.commit()
-        print(f"✅ Deleted {count:,} old records")
         
-        # Vacuum to reclaim space
-        print("🔧 Optimizing database...")
-        cursor.execute("VACUUM")
-        print("✅ Database optimized")
+        # Short transactions: the scanner can insert between batches
+        deleted = 0
+        while True:
+            cursor.execute("""
+                DELETE FROM wifi_scans WHERE rowid IN (
+                    SELECT rowid FROM wifi_scans WHERE timestamp < ? LIMIT ?
+                )
+            """, (cutoff_date, DELETE_BATCH_SIZE))
+            conn.commit()
+            if cursor.rowcount <= 0:
+                break
+            deleted += cursor.rowcount
+            print(f"Deleted {deleted:,} records...", end='\r')
+        print(f"\n✅ Deleted {deleted:,} old records")
+        
+        # Return free pages to the filesystem without rewriting the whole file
+        auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum == 2:  # INCREMENTAL
+            print("🔧 Releasing free pages...")
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+            print("✅ Database optimized")
+        else:
+            print("ℹ️  Run 'vacuum' once to enable incremental space reclaim")
     else:
         print("❌ Cleanup cancelled")
     
@@ -84,27 +125,26 @@ def cleanup_old_data(days):
 
 def export_to_csv(output_file, days=None):
     """Export database to CSV"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     
     if days:
         cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
         query = "SELECT * FROM wifi_scans WHERE timestamp >= ? ORDER BY timestamp"
-        cursor = conn.execute(query, (cutoff_date,))
+        params = (cutoff_date,)
     else:
         query = "SELECT * FROM wifi_scans ORDER BY timestamp"
-        cursor = conn.execute(query)
+        params = ()
     
-    # Get column names
-    columns = [description[0] for description in cursor.description]
+    cursor = conn.execute(query, params)
     
-    # Write to CSV
-    with open(output_file, 'w') as f:
-        f.write(','.join(columns) + '\n')
-        
-        count = 0
-        for row in cursor:
-            f.write(','.join(str(x) if x is not None else '' for x in row) + '\n')
-            count += 1
+    # Stream in chunks so memory stays flat; csv.writer formats and quotes in C
+    count = 0
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([description[0] for description in cursor.description])
+        while rows := cursor.fetchmany(EXPORT_CHUNK_SIZE):
+            writer.writerows(rows)
+            count += len(rows)
     
     conn.close()
     
@@ -113,51 +153,214 @@ def export_to_csv(output_file, days=None):
 
 def import_from_csv(csv_file):
     """Import CSV data into database"""
-    import csv
+    # Autocommit mode: the transaction below is managed explicitly
+    conn = get_connection(isolation_level=None)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # The scanner and dashboard share this file, so keep WAL's safe setting:
+    # NORMAL only syncs at checkpoints, and the import is one transaction anyway
+    conn.execute("PRAGMA synchronous=NORMAL")
     
     count = 0
-    with open(csv_file, 'r') as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
-            cursor.execute("""
-                INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                row.get('timestamp'),
-                row.get('room'),
-                row.get('ssid'),
-                row.get('bssid'),
-                row.get('signal'),
-                row.get('channel'),
-                row.get('frequency'),
-                row.get('security'),
-                row.get('vendor')
-            ))
+    
+    def read_rows(reader):
+        """Yield insert tuples in IMPORT_COLUMNS order; missing columns become NULL"""
+        nonlocal count
+        header = next(reader, [])
+        positions = [header.index(column) if column in header else None for column in IMPORT_COLUMNS]
+        for record in reader:
+            yield tuple(record[i] if i is not None and i < len(record) else None for i in positions)
             count += 1
-            
-            if count % 1000 == 0:
+            if count % IMPORT_PROGRESS_INTERVAL == 0:
                 print(f"Imported {count:,} records...", end='\r')
     
-    conn.commit()
-    conn.close()
+    with open(csv_file, newline='') as f:
+        conn.execute("BEGIN")
+        try:
+            # One statement, prepared once, fed by the generator from C
+            conn.executemany("""
+                INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, read_rows(csv.reader(f)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
     
     print(f"\n✅ Imported {count:,} records from {csv_file}")
 
 
+def ensure_indexes(conn=None):
+    """Create the column and indexes the dashboard queries rely on and refresh planner stats"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    
+    try:
+        # Nothing to index until the scanner has created the table
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wifi_scans'").fetchone() is None:
+            return
+        
+        # Databases created before the scanner added signal_dbm; VIRTUAL is
+        # the only kind ALTER TABLE can add
+        columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(wifi_scans)")]
+        if "signal_dbm" not in columns:
+            conn.execute(f"""
+                ALTER TABLE wifi_scans
+                ADD COLUMN signal_dbm REAL GENERATED ALWAYS AS ({SIGNAL_DBM_EXPR}) VIRTUAL
+            """)
+        
+        # Time-window filters, alone or grouped by room; its leftmost column
+        # makes a separate idx_timestamp redundant
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ts_room ON wifi_scans(timestamp, room)")
+        conn.execute("DROP INDEX IF EXISTS idx_timestamp")
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def reindex_db():
+    """Rebuild all indexes and refresh query planner statistics"""
+    print("🔧 Rebuilding indexes...")
+    
+    conn = get_connection()
+    ensure_indexes(conn)
+    conn.execute("REINDEX wifi_scans")
+    conn.execute("ANALYZE")
+    conn.close()
+    
+    print("✅ Indexes rebuilt")
+
+
+def ensure_rollup_tables(conn):
+    """Create the hourly rollup table and its watermark row"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS hourly_rollup (
+            hour TEXT NOT NULL,
+            room TEXT NOT NULL,
+            ssid TEXT NOT NULL,
+            bssid TEXT NOT NULL DEFAULT '',
+            avg_signal REAL,
+            n INTEGER NOT NULL,
+            channel INTEGER,
+            PRIMARY KEY (hour, room, ssid, bssid)
+        )
+    """)
+    # Highest wifi_scans.id already folded into hourly_rollup
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_watermark (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            last_id INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO rollup_watermark (id, last_id) VALUES (0, 0)")
+
+
+def update_rollup(conn, batch_size=None):
+    """
+    Fold scans newer than the watermark into hourly_rollup, at most batch_size of them.
+    Runs inside the caller's transaction; returns the number of rollup rows touched.
+    """
+    ensure_rollup_tables(conn)
+    last_id = conn.execute("SELECT last_id FROM rollup_watermark").fetchone()[0]
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM wifi_scans").fetchone()[0]
+    if max_id <= last_id:
+        return 0
+    if batch_size is not None:
+        # Bound by rows rather than ids: deletes leave gaps in the id range
+        batch_end = conn.execute(
+            "SELECT id FROM wifi_scans WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+            (last_id, batch_size - 1),
+        ).fetchone()
+        if batch_end is not None:
+            max_id = batch_end[0]
+    
+    # avg_signal is in dBm; merging keeps it a scan-weighted mean
+    cursor = conn.execute("""
+        INSERT INTO hourly_rollup (hour, room, ssid, bssid, avg_signal, n, channel)
+        SELECT substr(timestamp, 1, 13) || ':00:00', room, ssid, COALESCE(bssid, ''),
+               AVG(signal_dbm), COUNT(*), MAX(channel)
+        FROM wifi_scans
+        WHERE id > ? AND id <= ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (hour, room, ssid, bssid) DO UPDATE SET
+            avg_signal = (avg_signal * n + excluded.avg_signal * excluded.n) / (n + excluded.n),
+            n = n + excluded.n,
+            channel = COALESCE(excluded.channel, channel)
+    """, (last_id, max_id))
+    conn.execute("UPDATE rollup_watermark SET last_id = ?", (max_id,))
+    return cursor.rowcount
+
+
+def trim_rollup(conn, cutoff_date):
+    """
+    Remove rollup rows for scans older than cutoff_date (which are being deleted).
+    The hour containing the cutoff is rebuilt from the scans that remain in it.
+    Runs inside the caller's transaction.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hourly_rollup'").fetchone() is None:
+        return
+    
+    boundary_hour = cutoff_date[:13] + ":00:00"
+    next_hour = (datetime.strptime(boundary_hour, "%Y-%m-%d %H:%M:%S") + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("DELETE FROM hourly_rollup WHERE hour <= ?", (boundary_hour,))
+    # Only scans at or below the watermark; update_rollup folds in the rest later
+    conn.execute("""
+        INSERT INTO hourly_rollup (hour, room, ssid, bssid, avg_signal, n, channel)
+        SELECT ?, room, ssid, COALESCE(bssid, ''), AVG(signal_dbm), COUNT(*), MAX(channel)
+        FROM wifi_scans
+        WHERE timestamp >= ? AND timestamp < ?
+          AND id <= (SELECT last_id FROM rollup_watermark)
+        GROUP BY room, ssid, COALESCE(bssid, '')
+    """, (boundary_hour, cutoff_date, next_hour))
+
+
+def aggregate_incremental():
+    """Bring hourly_rollup up to date with new scans"""
+    conn = get_connection(isolation_level=None)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wifi_scans'").fetchone() is None:
+            return 0
+        
+        # Short transactions: the scanner can insert between batches (the
+        # first run after an upgrade folds in the whole history)
+        updated = 0
+        while True:
+            # IMMEDIATE: no scans can land between reading MAX(id) and moving the watermark
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                batch = update_rollup(conn, ROLLUP_BATCH_SIZE)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if batch == 0:
+                break
+            updated += batch
+    finally:
+        conn.close()
+    
+    return updated
+
+
 def vacuum_db():
     """Optimize and compact database"""
     print("🔧 Optimizing database...")
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # Get size before
     size_before = DB_PATH.stat().st_size / (1024 * 1024)
     
+    ensure_indexes(conn)
+    # Takes effect with this VACUUM; later cleanups can then free pages incrementally
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # Also applied by VACUUM, but not while in WAL mode (see migrate_schema)
+    cursor.execute(f"PRAGMA page_size={PAGE_SIZE}")
     cursor.execute("VACUUM")
     conn.commit()
     conn.close()
@@ -172,40 +375,110 @@ def vacuum_db():
     print(f"   Saved:  {saved:.2f} MB ({saved/size_before*100:.1f}%)")
 
 
+def migrate_schema():
+    """Rebuild wifi_scans with integer signal/channel values and a stored signal_dbm"""
+    print("🔧 Migrating wifi_scans schema...")
+    
+    conn = get_connection(isolation_level=None)
+    cursor = conn.cursor()
+    
+    # DROP TABLE takes the indexes with it; keep their definitions to recreate
+    cursor.execute("""
+        SELECT sql FROM sqlite_master
+        WHERE type = 'index' AND tbl_name = 'wifi_scans' AND sql IS NOT NULL
+    """)
+    index_sql = [row[0] for row in cursor.fetchall()]
+    
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(f"""
+            CREATE TABLE wifi_scans_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                room TEXT NOT NULL,
+                ssid TEXT NOT NULL,
+                bssid TEXT,
+                signal INTEGER,
+                channel INTEGER,
+                frequency TEXT,
+                security TEXT,
+                vendor TEXT,
+                signal_dbm REAL GENERATED ALWAYS AS ({SIGNAL_DBM_EXPR}) STORED
+            )
+        """)
+        # Averaged (REAL) and imported (TEXT) values stored as varint integers
+        cursor.execute("""
+            INSERT INTO wifi_scans_new (id, timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
+            SELECT id, timestamp, room, ssid, bssid, CAST(ROUND(signal) AS INTEGER),
+                   CAST(channel AS INTEGER), frequency, security, vendor
+            FROM wifi_scans
+        """)
+        migrated = cursor.rowcount
+        # Ids must keep growing past deleted rows, or new scans would reuse ids
+        # below the rollup and alert watermarks
+        seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'wifi_scans'").fetchone()
+        cursor.execute("DROP TABLE wifi_scans")
+        cursor.execute("ALTER TABLE wifi_scans_new RENAME TO wifi_scans")
+        if seq is not None:
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'wifi_scans'", (seq[0],))
+            if cursor.rowcount == 0:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('wifi_scans', ?)", (seq[0],))
+        for sql in index_sql:
+            cursor.execute(sql)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    
+    print(f"✅ Migrated {migrated:,} records")
+    
+    # VACUUM can only change the page size outside WAL mode, and leaving WAL
+    # needs the database to itself (stop the scanner and dashboard first)
+    conn = get_connection(isolation_level=None)
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    left_wal = False
+    if page_size != PAGE_SIZE:
+        try:
+            left_wal = conn.execute("PRAGMA journal_mode=DELETE").fetchone()[0] == 'delete'
+        except sqlite3.OperationalError:
+            pass
+        if not left_wal:
+            print(f"⚠️  Database in use; keeping {page_size}-byte pages")
+    
+    try:
+        # Reclaim the pages of the old table (and apply the page size)
+        vacuum_db()
+    finally:
+        if left_wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.close()
+
+
 def aggregate_old_data(days):
     """Aggregate old data to hourly averages"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # Autocommit mode: the replacement below is one explicit transaction
+    conn = get_connection(isolation_level=None)
     
     cutoff_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
     
     print(f"📊 Aggregating data older than {days} days to hourly averages...")
     
-    # Create temporary aggregated data
-    cursor.execute("""
-        CREATE TEMP TABLE aggregated AS
-        SELECT 
-            strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
-            room,
-            ssid,
-            bssid,
-            AVG(signal) as avg_signal,
-            channel,
-            frequency,
-            security,
-            vendor
-        FROM wifi_scans
-        WHERE timestamp < ?
-        GROUP BY hour, room, ssid, bssid
-    """, (cutoff_date,))
-    
-    # Count original records
-    cursor.execute("SELECT COUNT(*) FROM wifi_scans WHERE timestamp < ?", (cutoff_date,))
-    original_count = cursor.fetchone()[0]
-    
-    # Count aggregated records
-    cursor.execute("SELECT COUNT(*) FROM aggregated")
-    aggregated_count = cursor.fetchone()[0]
+    # Preview: raw scans in range and the hourly groups they collapse into
+    original_count, aggregated_count = conn.execute("""
+        SELECT COALESCE(SUM(n), 0), COUNT(*) FROM (
+            SELECT COUNT(*) AS n
+            FROM wifi_scans
+            WHERE timestamp < ?
+            GROUP BY strftime('%Y-%m-%d %H:00:00', timestamp), room, ssid, bssid
+        )
+    """, (cutoff_date,)).fetchone()
+    
+    if original_count == 0:
+        print(f"✅ No records older than {days} days found")
+        conn.close()
+        return
     
     print(f"   Original records: {original_count:,}")
     print(f"   Aggregated records: {aggregated_count:,}")
@@ -214,17 +487,40 @@ def aggregate_old_data(days):
     confirm = input("Replace old data with aggregates? (yes/no): ")
     
     if confirm.lower() == 'yes':
-        # Delete old data
-        cursor.execute("DELETE FROM wifi_scans WHERE timestamp < ?", (cutoff_date,))
-        
-        # Insert aggregated data
-        cursor.execute("""
-            INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
-            SELECT hour, room, ssid, bssid, avg_signal, channel, frequency, security, vendor
-            FROM aggregated
-        """)
-        
-        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Roll up the raw scans first; the aggregates inserted below must not be counted again
+            update_rollup(conn)
+            
+            # Aggregates go in straight from the raw rows, which are then deleted;
+            # the id bound keeps the freshly inserted hourly rows out of the delete
+            last_raw_id = conn.execute("SELECT MAX(id) FROM wifi_scans").fetchone()[0]
+            conn.execute("""
+                WITH aggregated AS (
+                    SELECT
+                        strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
+                        room,
+                        ssid,
+                        bssid,
+                        CAST(ROUND(AVG(signal)) AS INTEGER) as avg_signal,
+                        channel,
+                        frequency,
+                        security,
+                        vendor
+                    FROM wifi_scans
+                    WHERE timestamp < ? AND id <= ?
+                    GROUP BY hour, room, ssid, bssid
+                )
+                INSERT INTO wifi_scans (timestamp, room, ssid, bssid, signal, channel, frequency, security, vendor)
+                SELECT hour, room, ssid, bssid, avg_signal, channel, frequency, security, vendor
+                FROM aggregated
+            """, (cutoff_date, last_raw_id))
+            conn.execute("DELETE FROM wifi_scans WHERE timestamp < ? AND id <= ?", (cutoff_date, last_raw_id))
+            conn.execute("UPDATE rollup_watermark SET last_id = (SELECT MAX(id) FROM wifi_scans)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
         print("✅ Old data aggregated successfully")
         
         # Optimize
@@ -246,6 +542,7 @@ def main():
     # Cleanup command
     cleanup_parser = subparsers.add_parser('cleanup', help='Delete old data')
     cleanup_parser.add_argument('--days', type=int, default=30, help='Delete data older than N days')
+    cleanup_parser.add_argument('--yes', action='store_true', help='Skip the confirmation prompt (for cron)')
     
     # Export command
     export_parser = subparsers.add_parser('export', help='Export data to CSV')
@@ -259,6 +556,15 @@ def main():
     # Vacuum command
     subparsers.add_parser('vacuum', help='Optimize database')
     
+    # Reindex command
+    subparsers.add_parser('reindex', help='Rebuild indexes and planner statistics')
+    
+    # Rollup command
+    subparsers.add_parser('rollup', help='Update the hourly rollup table with new scans')
+    
+    # Migrate command
+    subparsers.add_parser('migrate_schema', help='Rebuild the scans table with integer signal values')
+    
     # Aggregate command
     aggregate_parser = subparsers.add_parser('aggregate', help='Aggregate old data to hourly averages')
     aggregate_parser.add_argument('--days', type=int, default=7, help='Aggregate data older than N days')
@@ -273,13 +579,20 @@ def main():
     if args.command == 'stats':
         get_stats()
     elif args.command == 'cleanup':
-        cleanup_old_data(args.days)
+        cleanup_old_data(args.days, assume_yes=args.yes)
     elif args.command == 'export':
         export_to_csv(args.output, args.days)
     elif args.command == 'import':
         import_from_csv(args.input)
     elif args.command == 'vacuum':
         vacuum_db()
+    elif args.command == 'reindex':
+        reindex_db()
+    elif args.command == 'rollup':
+        updated = aggregate_incremental()
+        print(f"✅ Hourly rollup updated ({updated:,} rows)")
+    elif args.command == 'migrate_schema':
+        migrate_schema()
     elif args.command == 'aggregate':
         aggregate_old_data(args.days)
     else:
@@ -0,0 +1,74 @@
+"""
+Tests for the alert system's running-average checks
+Run with: python -m unittest test_alerts
+"""
+
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import alerts
+
+
+class SignalDegradationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        data = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(alerts, "DB_PATH", data / "wifi_data.db"),
+            mock.patch.object(alerts, "ALERTS_FILE", data / "alerts.jsonl"),
+            mock.patch.object(alerts, "LEGACY_ALERTS_FILE", data / "alerts.json"),
+            mock.patch.object(alerts, "ALERT_STATE_FILE", data / "alert_state.json"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        conn = sqlite3.connect(alerts.DB_PATH)
+        conn.execute("""
+            CREATE TABLE wifi_scans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                room TEXT NOT NULL,
+                ssid TEXT NOT NULL,
+                signal INTEGER,
+                signal_dbm REAL GENERATED ALWAYS AS (signal / 2.0 - 100.0) VIRTUAL
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    def insert_step(self, drop_db, minutes_since_drop):
+        """One scan a minute at -60 dBm, then a sustained drop of drop_db"""
+        now = datetime.now()
+        rows = []
+        for minutes_ago in range(110, -1, -1):
+            dbm = -60 - drop_db if minutes_ago <= minutes_since_drop else -60
+            timestamp = (now - timedelta(minutes=minutes_ago)).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((timestamp, "Office", "HomeNet", int((dbm + 100) * 2)))
+
+        conn = sqlite3.connect(alerts.DB_PATH)
+        conn.executemany("INSERT INTO wifi_scans (timestamp, room, ssid, signal) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+
+    def test_12_db_step_alerts(self):
+        self.insert_step(drop_db=12, minutes_since_drop=35)
+        found = alerts.AlertSystem().check_signal_degradation()
+        self.assertEqual(len(found), 1)
+        self.assertLess(found[0]["data"]["degradation"], alerts.SIGNAL_DEGRADATION_THRESHOLD)
+
+    def test_small_step_does_not_alert(self):
+        self.insert_step(drop_db=5, minutes_since_drop=35)
+        self.assertEqual(alerts.AlertSystem().check_signal_degradation(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
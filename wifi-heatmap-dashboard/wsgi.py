@@ -0,0 +1,11 @@
+"""
+WSGI entry point for the dashboard.
+
+Run with a production server from this directory, e.g.:
+    waitress-serve --threads=8 --port=5000 wsgi:app
+"""
+
+from app import app, run_server
+
+if __name__ == "__main__":
+    run_server()